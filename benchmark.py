@@ -0,0 +1,273 @@
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+from datetime import date, datetime, timedelta, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from main import (
+    iter_gpx_segments, iter_gpx_segments_gpxpy, load_gpx_files, load_segments, add_gpx_to_map, build_routes,
+    group_routes, save_routes_to_js, build_search_index, build_spatial_index, serialize_routes, iter_html, write_template_page,
+    write_chunks_if_changed, parse_args,
+)
+
+# Místa výprav pro názvy syntetických souborů
+PLACES = ['Krkonoše', 'Orlické hory', 'Broumovsko', 'Adršpach', 'Jizerské hory', 'Šumava', 'Český ráj',
+          'Hraboší doupě', 'Žďárské vrchy', 'Beskydy', 'Jeseníky', 'Třeboňsko']
+
+# Vytvoření syntetického GPX souboru: plynulá chůze (~1,3 m/s, záznam po 1 s) s náhodně
+# se stáčejícím směrem, výškovým profilem a časy bodů; každý segment začíná po přestávce
+def write_synthetic_gpx(path, segments, points, seed=0, start=None, elevation=True, times=True,
+                        origin=(50.209, 15.832)):
+    rnd = random.Random(seed)
+    lat, lon = origin[0] + rnd.uniform(-0.2, 0.2), origin[1] + rnd.uniform(-0.3, 0.3)
+    heading = rnd.uniform(0, 2 * math.pi)
+    timestamp = (start or datetime(2024, 5, 1, 8, tzinfo=timezone.utc)).timestamp()
+    base_elevation = rnd.uniform(250, 1200)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<gpx version="1.1" creator="benchmark" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        f.write('<trk><name>benchmark</name>\n')
+        for _ in range(segments):
+            f.write('<trkseg>\n')
+            for i in range(points):
+                heading += rnd.gauss(0, 0.08)
+                step = rnd.uniform(1.0, 1.6)
+                lat += step * math.cos(heading) / 111_320
+                lon += step * math.sin(heading) / (111_320 * math.cos(math.radians(lat)))
+                timestamp += 1
+                f.write(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}">')
+                if elevation:
+                    ele = base_elevation + 80 * math.sin(i / 900) + rnd.uniform(-1.5, 1.5)
+                    f.write(f'<ele>{ele:.1f}</ele>')
+                if times:
+                    f.write(f'<time>{datetime.fromtimestamp(timestamp, timezone.utc):%Y-%m-%dT%H:%M:%SZ}</time>')
+                f.write('</trkpt>\n')
+            f.write('</trkseg>\n')
+            timestamp += rnd.randint(300, 3600)
+        f.write('</trk>\n</gpx>\n')
+
+# Archiv syntetických výprav pojmenovaných 'YYYYMMDD - název.gpx' rozložených do zadaných let;
+# část výprav je vícedenních (stejné místo v po sobě jdoucích dnech)
+def generate_archive(directory, files, points, segments=1, years=(2023, 2024, 2025), seed=0,
+                     elevation=True, times=True):
+    rnd = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = set()
+    while len(paths) < files:
+        day = date(rnd.choice(years), 1, 1) + timedelta(days=rnd.randrange(365))
+        place = rnd.choice(PLACES)
+        for offset in range(rnd.choice([1, 1, 1, 2, 3])):
+            if len(paths) >= files:
+                break
+            current = day + timedelta(days=offset)
+            path = os.path.join(directory, f'{current:%Y%m%d} - {place}.gpx')
+            if path in paths:
+                continue
+            paths.add(path)
+            start = datetime(current.year, current.month, current.day, 8, tzinfo=timezone.utc)
+            write_synthetic_gpx(path, segments, points, seed=rnd.randrange(2**32), start=start,
+                                elevation=elevation, times=times)
+    return sorted(paths)
+
+# Výsledek, doba a špička alokované paměti volání funkce
+# (paměť se měří ve druhém běhu, tracemalloc běh výrazně zpomaluje)
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def benchmark_parsers(sizes, segments):
+    readers = [('iterparse', iter_gpx_segments), ('gpxpy', iter_gpx_segments_gpxpy)]
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'bodů':>10} {'parser':>10} {'čas [s]':>10} {'paměť [MB]':>12}")
+        for size in sizes:
+            path = os.path.join(directory, f'{size}.gpx')
+            write_synthetic_gpx(path, segments, size // segments)
+            for name, reader in readers:
+                count, elapsed, peak = measure(lambda: sum(len(points) for points, _, _ in reader(path)))
+                print(f'{count:>10} {name:>10} {elapsed:>10.3f} {peak / 2**20:>12.1f}')
+
+# Dříve se pro každý segment stavěl nepoužitý objekt folium.PolyLine
+def build_folium_map(routes):
+    import folium
+
+    map_obj = folium.Map(location=[50.209, 15.832], zoom_start=13, control_scale=True)
+    for route in routes:
+        folium.PolyLine(
+            route['points'],
+            color=route['color'],
+            popup=f"<b>{route['title']}</b><br>{route['date']}",
+        ).add_to(map_obj)
+    return map_obj
+
+
+def benchmark_renderers(files, segments, points):
+    args = parse_args([])
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            generate_archive('gpx', files, points, segments)
+            routes = add_gpx_to_map(load_gpx_files('gpx'))
+
+            start = time.perf_counter()
+            import folium  # noqa: F401
+            import_time = time.perf_counter() - start
+
+            _, template_time, template_peak = measure(write_template_page, routes, args, 'mapa.html')
+            _, folium_time, folium_peak = measure(build_folium_map, routes)
+        finally:
+            os.chdir(cwd)
+
+    print(f'{files} souborů, {len(routes)} segmentů')
+    print(f"{'krok':>28} {'čas [s]':>10} {'paměť [MB]':>12}")
+    print(f"{'stránka ze šablony':>28} {template_time:>10.3f} {template_peak / 2**20:>12.1f}")
+    print(f"{'import folium':>28} {import_time:>10.3f} {'':>12}")
+    print(f"{'nepoužitá mapa folium':>28} {folium_time:>10.3f} {folium_peak / 2**20:>12.1f}")
+
+
+# Špička RSS procesu v MB od startu procesu (na Windows není k dispozici)
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux udává kB, macOS bajty
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+# Vynulování špičky RSS (Linux: zápis 5 do clear_refs nastaví VmHWM na aktuální RSS);
+# False pokud to systém neumí
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+# Špička RSS v MB od posledního reset_peak_rss (VmHWM z /proc/self/status)
+def stage_peak_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+# Jednotlivé kroky sestavení nad archivem v adresáři; běží v samostatném procesu,
+# aby špička RSS patřila jen jednomu archivu. Špička RSS kroku se měří jen tam, kde ji
+# lze před krokem vynulovat (Linux), jinak je ve výsledku None a celková špička je v posledním řádku
+def run_pipeline(directory, queue):
+    os.chdir(directory)
+    results = []
+
+    def stage(name, function, *args, size=None):
+        resettable = reset_peak_rss()
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        results.append((name, elapsed, stage_peak_rss() if resettable else None,
+                        size(result) if size else len(result)))
+        return result
+
+    gpx_files = stage('load_gpx_files', load_gpx_files, 'gpx')
+    segments = stage('parsování', load_segments, gpx_files,
+                     size=lambda result: sum(len(segment['points']) for item in result.values() for segment in item))
+    routes = stage('build_routes', build_routes, gpx_files, segments,
+                   size=lambda result: sum(len(route['points']) for route in result))
+    data_routes = stage('group_routes', group_routes, routes)
+    data_for_js = stage('save_routes_to_js', save_routes_to_js, routes)
+    search_index = stage('vyhledávací index', build_search_index, data_for_js, routes,
+                         size=lambda result: len(result['grams']))
+    spatial_index = stage('prostorový index', build_spatial_index, routes,
+                          size=lambda result: len(result['cells']))
+    serialized = serialize_routes(routes)
+    # Stránka se jako při sestavení vykresluje po částech rovnou do souboru
+    stage('HTML', lambda: write_chunks_if_changed(
+        'mapa.html', iter_html(serialized, data_for_js, data_routes, spatial_index, search_index)
+    ), size=lambda result: os.path.getsize('mapa.html'))
+    queue.put((results, peak_rss()))
+
+
+def benchmark_pipeline(sizes, points, segments, years, elevation, times):
+    context = multiprocessing.get_context('spawn')
+    print(f"{'souborů':>8} {'krok':>18} {'čas [s]':>10} {'RSS [MB]':>10} {'velikost':>12}")
+    for files in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            generate_archive(os.path.join(directory, 'gpx'), files, points, segments, years,
+                             elevation=elevation, times=times)
+            queue = context.Queue()
+            process = context.Process(target=run_pipeline, args=(directory, queue))
+            process.start()
+            results, process_rss = queue.get()
+            process.join()
+        total = 0
+        for name, elapsed, rss, size in results:
+            total += elapsed
+            rss = f'{rss:>10.1f}' if rss is not None else f"{'-':>10}"
+            print(f'{files:>8} {name:>18} {elapsed:>10.3f} {rss} {size:>12}')
+        # Nulování špičky mění i ru_maxrss, celková špička je pak největší špička kroku
+        stage_peaks = [rss for _, _, rss, _ in results if rss is not None]
+        process_rss = max(stage_peaks) if stage_peaks else process_rss
+        process_rss = f'{process_rss:>10.1f}' if process_rss is not None else f"{'-':>10}"
+        print(f"{files:>8} {'celkem':>18} {total:>10.3f} {process_rss}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Měření rychlosti jednotlivých částí sestavení mapy.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    generate = subparsers.add_parser('generate', help='vytvoření syntetického archivu GPX souborů')
+    pipeline = subparsers.add_parser('pipeline', help='čas, špička RSS a velikost výstupu jednotlivých kroků '
+                                                      'sestavení pro archivy různé velikosti')
+    for command in (generate, pipeline):
+        command.add_argument('--points', type=int, default=3000, help='počet bodů v segmentu')
+        command.add_argument('--segments', type=int, default=1, help='počet segmentů v souboru')
+        command.add_argument('--years', type=int, nargs='+', default=[2023, 2024, 2025],
+                             help='roky, do kterých se výpravy rozloží')
+        command.add_argument('--no-elevation', dest='elevation', action='store_false', help='body bez výšky')
+        command.add_argument('--no-time', dest='times', action='store_false', help='body bez času')
+    generate.add_argument('directory', help='cílový adresář')
+    generate.add_argument('--files', type=int, default=100, help='počet souborů')
+    generate.add_argument('--seed', type=int, default=0, help='semínko generátoru')
+    pipeline.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 800],
+                          help='počty souborů v testovaných archivech')
+
+    parsers = subparsers.add_parser('parsers', help='srovnání načítání GPX přes iterparse a gpxpy')
+    parsers.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000],
+                         help='počty bodů v testovacích souborech')
+    parsers.add_argument('--segments', type=int, default=4, help='počet segmentů v souboru')
+
+    renderers = subparsers.add_parser('renderers', help='cena dříve stavěné nepoužité mapy folium')
+    renderers.add_argument('--files', type=int, default=300, help='počet souborů v archivu')
+    renderers.add_argument('--segments', type=int, default=2, help='počet segmentů v souboru')
+    renderers.add_argument('--points', type=int, default=2000, help='počet bodů v segmentu')
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        generate_archive(args.directory, args.files, args.points, args.segments, args.years, args.seed,
+                         args.elevation, args.times)
+    elif args.command == 'pipeline':
+        benchmark_pipeline(args.sizes, args.points, args.segments, args.years, args.elevation, args.times)
+    elif args.command == 'parsers':
+        benchmark_parsers(args.sizes, args.segments)
+    else:
+        benchmark_renderers(args.files, args.segments, args.points)
+
+
+if __name__ == '__main__':
+    main()
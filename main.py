@@ -1,153 +1,1419 @@
-import folium
 import gpxpy
+import numpy as np
 import os
 import json
-from datetime import datetime
+import gzip
+import hashlib
+import struct
+import zlib
+import shutil
+import re
+import sqlite3
+import time
+import pstats
+import cProfile
+import argparse
+import tracemalloc
+import unicodedata
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
 from collections import defaultdict
+from itertools import chain
 
-# Funkce pro načtení GPX souborů a filtrování podle data
+from server import serve, start_server
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Výstupní stránka s mapou
+OUTPUT_FILE = 'mapa.html'
+# Soubor s mezipamětí již zpracovaných GPX souborů
+CACHE_FILE = '.gpx_cache.sqlite'
+# Sloupcový archiv sestavených tras (režim --archive): souřadnice v .npy polích, metadata v JSON
+ARCHIVE_DIR = '.gpx_archive'
+ARCHIVE_VERSION = 4
+# Index souborů archivu z posledního sestavení: cesta -> datum, název, velikost, čas změny
+INDEX_FILE = '.gpx_index.json'
+INDEX_VERSION = 1
+# Výchozí tolerance zjednodušení tras v metrech (0 = bez zjednodušení)
+SIMPLIFY_TOLERANCE = 2.0
+# Počet desetinných míst souřadnic ve formátu encoded polyline
+POLYLINE_PRECISION = 5
+# Úrovně detailu tras: (nejvyšší zoom úrovně, tolerance zjednodušení v metrech),
+# nad poslední úrovní se kreslí plné body trasy
+LOD_TIERS = [(10, 50.0), (13, 6.0)]
+# Adresář (vedle mapa.html) s daty stránky v režimu --dist
+DATA_DIR = 'data'
+# Adresář (vedle mapa.html) s daty jednotlivých tras v režimu --split
+ROUTE_DATA_DIR = 'data/trasy'
+# Seznam souborů sestavení s velikostmi (režim --dist)
+MANIFEST_FILE = 'manifest.json'
+# Měření průběhu sestavení (režim --report) a profil z cProfile (režim --cprofile)
+REPORT_FILE = 'mapa.report.json'
+PROFILE_FILE = 'mapa.prof'
+# Heatmapa všech tras (režim --heatmap): obrázek vedle mapa.html, počet pixelů delší strany
+# a nejvyšší zoom, do kterého stránka místo tras zobrazuje heatmapu
+HEATMAP_FILE = 'mapa-heatmap.png'
+HEATMAP_SIZE = 2048
+HEATMAP_MAX_ZOOM = 11
+# Poloměr Země ve Web Mercatoru (EPSG:3857) pro world file heatmapy
+MERCATOR_RADIUS = 6378137.0
+# Předem vykreslené dlaždice tras (režim --tiles): adresář, zoomy a velikost dlaždice;
+# nad nejvyšším zoomem dlaždic stránka kreslí trasy jako vektory
+TILE_DIR = 'data/dlazdice'
+TILE_ZOOMS = range(5, 15)
+TILE_SIZE = 256
+# Barvy trasy v heatmapě od nejméně po nejvíce projížděná místa
+HEATMAP_COLORS = [(255, 237, 160), (253, 141, 60), (189, 0, 38)]
+# Náhodná id prvků ve stránce vykreslené knihovnou folium (backend folium)
+FOLIUM_ID_PATTERN = re.compile(r'_[0-9a-f]{32}')
+# Barvy tras podle roku; roky bez pevné barvy dostanou barvu z palety podle čísla roku,
+# takže barva nezávisí na ostatních letech v archivu
+YEAR_COLORS = {2023: '#0000FF', 2024: '#FF0000', 2025: '#008000'}
+YEAR_PALETTE = ['#FF8C00', '#8B008B', '#008B8B', '#B8860B', '#C71585', '#556B2F', '#4B0082', '#A0522D']
+# Vzdálenost kliknutí od trasy v pixelech, do které se v režimu --canvas otevře její popup
+HIT_TOLERANCE = 8
+# Nejvyšší počet návrhů při vyhledávání
+SEARCH_LIMIT = 10
+# Velikost buňky prostorového indexu ve stupních (0.05° ≈ 5 km)
+GRID_CELL_SIZE = 0.05
+# Největší vzdálenost (m) části trasy od dřívější trasy, aby se nahradila odkazem na její body,
+# a nejmenší délka (m) takové části (kratší shody jsou např. křížení cest)
+SHARED_TOLERANCE = 20
+SHARED_MIN_LENGTH = 50
+# Souhrnné statistiky výprav ve strojově čitelné podobě
+STATS_FILE = 'statistiky.json'
+# Nejnižší rychlost (m/s), od které se úsek počítá do času v pohybu
+MOVING_SPEED = 0.5
+# Poloměr (m) klouzavého průměru výšek po trase před výpočtem stoupání a klesání (šum GPS)
+ELEVATION_SMOOTHING = 50
+# Verze formátu dat v mezipaměti, při změně se mezipaměť zahodí
+CACHE_VERSION = 2
+EARTH_RADIUS = 6371000.0
+
+# Funkce pro načtení GPX souborů a filtrování podle data; soubory s neplatným názvem se vypíšou
+# a přeskočí
 def load_gpx_files(directory):
-    gpx_files = []
-    for filename in os.listdir(directory):
-        if filename.endswith('.gpx'):
-            date_str, title = filename.split(' - ', 1)
-            date_str = date_str.strip()
-            file_date = datetime.strptime(date_str, '%Y%m%d')
-            gpx_files.append((os.path.join(directory, filename), file_date, title.strip('.gpx')))
+    gpx_files, index = scan_gpx_files(directory)
+    print_malformed(index)
     return gpx_files
 
+# Rekurzivní průchod adresářem (např. podadresáře po rocích) přes os.scandir, DirEntry si
+# výsledek stat pamatuje; skryté soubory a adresáře se přeskočí
+def iter_gpx_entries(directory):
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_gpx_entries(entry.path)
+            elif entry.name.lower().endswith('.gpx') and entry.is_file():
+                yield entry
+
+# Datum ('YYYYMMDD') a název výpravy z názvu souboru 'YYYYMMDD - název.gpx', jinak ValueError
+def parse_gpx_filename(filename):
+    date_str, separator, title = filename[:-len('.gpx')].partition(' - ')
+    date_str = date_str.strip()
+    if not separator or not title or len(date_str) != 8 or not date_str.isdigit():
+        raise ValueError("název neodpovídá tvaru 'YYYYMMDD - název.gpx'")
+    try:
+        datetime.strptime(date_str, '%Y%m%d')
+    except ValueError:
+        raise ValueError(f'neplatné datum {date_str}') from None
+    return date_str, title
+
+# Soubory archivu seřazené podle názvu (tj. podle data i napříč podadresáři) a jejich index;
+# datum a název souborů z předchozího indexu previous se znovu nerozebírají. Soubory
+# s neplatným názvem jsou v indexu pod 'malformed' i s důvodem
+def scan_gpx_files(directory, previous=None):
+    known = previous['files'] if previous else {}
+    files = {}
+    malformed = {}
+    for entry in sorted(iter_gpx_entries(directory), key=lambda entry: (entry.name, entry.path)):
+        stat = entry.stat()
+        if entry.path in known:
+            date_str, title = known[entry.path]['date'], known[entry.path]['title']
+        else:
+            try:
+                date_str, title = parse_gpx_filename(entry.name)
+            except ValueError as error:
+                malformed[entry.path] = str(error)
+                continue
+        files[entry.path] = {'date': date_str, 'title': title, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    gpx_files = [
+        (path, datetime(int(entry['date'][:4]), int(entry['date'][4:6]), int(entry['date'][6:])), entry['title'])
+        for path, entry in files.items()
+    ]
+    return gpx_files, {'version': INDEX_VERSION, 'files': files, 'malformed': malformed}
+
+# Soubory přidané nebo změněné (velikost, čas změny) a odebrané oproti předchozímu indexu
+def changed_files(index, previous=None):
+    known = previous['files'] if previous else {}
+    changed = [
+        path for path, entry in index['files'].items()
+        if (known.get(path, {}).get('size'), known.get(path, {}).get('mtime_ns')) != (entry['size'], entry['mtime_ns'])
+    ]
+    removed = [path for path in known if path not in index['files']]
+    return changed, removed
+
+# Výpis přeskočených souborů s neplatným názvem, kromě již vypsaných v reported
+def print_malformed(index, reported=()):
+    for path, error in index['malformed'].items():
+        if path not in reported:
+            print(f'Soubor {path} přeskočen: {error}')
+
+# Index z posledního sestavení, None pokud chybí nebo má jinou verzi
+def load_file_index(path):
+    try:
+        with open(path, encoding='utf-8') as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('version') == INDEX_VERSION else None
+
+def write_file_index(path, index):
+    write_if_changed(path, json.dumps(index, ensure_ascii=False))
+
 # najít střed trasy
+# (body mohou být i pole NumPy z archivu; kumulativní součet sčítá postupně jako sum())
 def calculate_center(points):
-    if not points:
+    if len(points) == 0:
+        return None
+    center_lat, center_lon = np.cumsum(np.asarray(points, dtype=float), axis=0)[-1] / len(points)
+    return (float(center_lat), float(center_lon))
+
+# Zjednodušení trasy algoritmem Douglas-Peucker, vzdálenosti v metrech
+def simplify_points(points, tolerance):
+    if tolerance <= 0 or len(points) < 3:
+        return points
+    coords = np.asarray(points, dtype=float)
+    # Lokální rovinná projekce (x = délka, y = šířka) v metrech
+    xy = np.radians(coords[:, ::-1]) * EARTH_RADIUS
+    xy[:, 0] *= np.cos(np.radians(coords[:, 0].mean()))
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = xy[start]
+        ab = xy[end] - a
+        ap = xy[start + 1:end] - a
+        # Vzdálenost bodů od úsečky start-end
+        length2 = ab @ ab
+        if length2 > 0:
+            t = np.clip(ap @ ab / length2, 0.0, 1.0)
+            ap = ap - t[:, None] * ab
+        distances = np.hypot(ap[:, 0], ap[:, 1])
+        farthest = distances.argmax()
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    if isinstance(points, np.ndarray):
+        return points[keep]
+    return [points[i] for i in np.flatnonzero(keep)]
+
+# Čas bodu v sekundách od epochy
+def parse_time(text):
+    return datetime.fromisoformat(text.strip().replace('Z', '+00:00')).timestamp()
+
+# Rychlé čtení bodů tras (trk/trkseg/trkpt) proudově přes iterparse, bez objektového modelu gpxpy;
+# pro každý segment vrací body (šířka, délka), výšky a časy (chybějící hodnoty jsou None)
+def iter_gpx_segments(gpx_file):
+    points = elevations = times = None
+    ele = time = None
+    for event, element in ET.iterparse(gpx_file, events=('start', 'end')):
+        tag = element.tag.rpartition('}')[2]
+        if event == 'start':
+            if tag == 'trkseg':
+                points, elevations, times = [], [], []
+            elif tag == 'trkpt':
+                ele = time = None
+            continue
+        if tag == 'ele':
+            ele = element.text
+        elif tag == 'time':
+            time = element.text
+        elif tag == 'trkpt' and points is not None:
+            points.append((float(element.attrib['lat']), float(element.attrib['lon'])))
+            elevations.append(float(ele) if ele else None)
+            times.append(parse_time(time) if time else None)
+        elif tag == 'trkseg':
+            yield points, elevations, times
+            points = elevations = times = None
+        # Zpracované elementy se hned uvolní, paměť neroste s délkou trasy
+        element.clear()
+
+# Body tras přes gpxpy, pomalejší ale tolerantnější k poškozeným souborům
+def iter_gpx_segments_gpxpy(gpx_file):
+    with open(gpx_file, 'r') as f:
+        gpx = gpxpy.parse(f)
+    for track in gpx.tracks:
+        for segment in track.segments:
+            yield (
+                [(point.latitude, point.longitude) for point in segment.points],
+                [point.elevation for point in segment.points],
+                [point.time.timestamp() if point.time else None for point in segment.points],
+            )
+
+# Ohraničení trasy [[jih, západ], [sever, východ]]
+def calculate_bounds(points):
+    if len(points) == 0:
+        return None
+    coords = np.asarray(points, dtype=float)
+    return [coords.min(axis=0).tolist(), coords.max(axis=0).tolist()]
+
+# Zhuštění hran: hrana i (začátek origins[i], vektor deltas[i]) se rozdělí na steps[i] stejných dílů.
+# Vrací body dílů (bez koncových bodů hran), číslo hrany a podíl hrany (0 až < 1) každého bodu
+def densify_edges(origins, deltas, steps):
+    edges = np.repeat(np.arange(len(steps)), steps)
+    t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+    return origins[edges] + deltas[edges] * t[:, None], edges, t
+
+# Buňky mřížky, kterými trasa prochází; delší úseky se zhustí, aby nepřeskočily buňku
+def route_cells(points, cell_size):
+    coords = np.asarray(points, dtype=float) / cell_size
+    if len(coords) > 1:
+        deltas = np.diff(coords, axis=0)
+        steps = np.ceil(2 * np.abs(deltas).max(axis=1)).astype(np.int64) + 1
+        samples, _, _ = densify_edges(coords[:-1], deltas, steps)
+        coords = np.vstack([samples, coords[-1:]])
+    return np.unique(np.floor(coords).astype(np.int64), axis=0)
+
+# Prostorový index: ohraničení výprav (všech segmentů souboru) a mřížka buňka -> id tras
+def build_spatial_index(routes, cell_size=GRID_CELL_SIZE):
+    cells = defaultdict(list)
+    for route_id, route in enumerate(routes):
+        if len(route['points']):
+            for i, j in route_cells(route['points'], cell_size).tolist():
+                cells[f'{i},{j}'].append(route_id)
+
+    trips = []
+    with_points = [route for route in routes if route['bounds'] is not None]
+    if with_points:
+        bounds = np.array([route['bounds'] for route in with_points], dtype=float)
+        trip_ids = np.array([route['trip'] for route in with_points])
+        starts = np.flatnonzero(np.r_[True, trip_ids[1:] != trip_ids[:-1]])
+        south_west = np.minimum.reduceat(bounds[:, 0], starts)
+        north_east = np.maximum.reduceat(bounds[:, 1], starts)
+        trip_bounds = dict(zip(trip_ids[starts].tolist(), zip(south_west.tolist(), north_east.tolist())))
+        trips = [list(trip_bounds.get(trip_id, ())) or None for trip_id in range(routes[-1]['trip'] + 1)]
+    return {'cellSize': cell_size, 'cells': cells, 'trips': trips}
+
+# Vzdálenosti bodů trasy od jejího začátku v metrech (každá hrana v rovinné aproximaci)
+def route_arc(coords):
+    lat = np.radians(coords[:, 0])
+    delta = np.radians(np.diff(coords, axis=0))
+    delta[:, 1] *= np.cos((lat[1:] + lat[:-1]) / 2)
+    return np.concatenate([[0.0], np.cumsum(np.hypot(delta[:, 0], delta[:, 1]) * EARTH_RADIUS)])
+
+# Trasa zhuštěná na body nejvýše step metrů od sebe; poloha bodu na trase je číslo hrany + podíl
+# hrany, body trasy mají celočíselnou polohu. Vrací body a jejich polohy
+def route_samples(coords, arc, step):
+    steps = np.maximum(np.ceil(np.diff(arc) / step), 1).astype(np.int64)
+    samples, edges, t = densify_edges(coords[:-1], np.diff(coords, axis=0), steps)
+    return np.vstack([samples, coords[-1:]]), np.append(edges + t, len(coords) - 1)
+
+# Klíče buněk přibližně čtvercové mřížky s buňkami cell_size metrů (délka se v každém řádku mřížky
+# zkrátí kosinem jeho šířky); s neighbors i klíče osmi sousedních buněk. Vrací pole (body, klíče)
+def metric_cell_keys(coords, cell_size, neighbors=False):
+    scale = np.pi / 180 * EARTH_RADIUS
+    rows = np.floor(coords[:, 0] * scale / cell_size).astype(np.int64)
+    shifts = (-1, 0, 1) if neighbors else (0,)
+    keys = []
+    for row_shift in shifts:
+        row = rows + row_shift
+        columns = np.floor(coords[:, 1] * scale * np.cos(np.radians((row + 0.5) * cell_size / scale))
+                           / cell_size).astype(np.int64)
+        for column_shift in shifts:
+            keys.append((row << 32) | ((columns + column_shift) & 0xffffffff))
+    return np.stack(keys, axis=1)
+
+# Nejbližší sdílitelná hrana (do vzdálenosti tolerance) pro každý bod; edge_keys a edge_ids jsou
+# buňky a hrany (číslo prvního bodu v coords) seřazené podle buňky, hrany s edge_span -1 sdílet
+# nelze. Vrací hranu bodu (-1 bez shody) a podíl hrany nejbližšího místa
+def nearest_edges(samples, edge_keys, edge_ids, edge_span, coords, tolerance):
+    keys = metric_cell_keys(samples, 2 * tolerance, neighbors=True)
+    starts = np.searchsorted(edge_keys, keys.ravel(), 'left')
+    counts = np.searchsorted(edge_keys, keys.ravel(), 'right') - starts
+    sample_ids = np.repeat(np.arange(keys.size) // keys.shape[1], counts)
+    candidates = edge_ids[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+    usable = edge_span[candidates] >= 0
+    sample_ids, candidates = sample_ids[usable], candidates[usable]
+
+    # Vzdálenost od hrany v místní rovinné projekci kolem bodu
+    query = samples[sample_ids]
+    scale = np.column_stack([np.ones(len(query)), np.cos(np.radians(query[:, 0]))]) * (np.pi / 180 * EARTH_RADIUS)
+    a = (coords[candidates] - query) * scale
+    ab = (coords[candidates + 1] - query) * scale - a
+    length2 = (ab * ab).sum(axis=1)
+    t = np.clip(-(a * ab).sum(axis=1) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    distances = np.hypot(*(a + t[:, None] * ab).T)
+
+    close = np.flatnonzero(distances <= tolerance)
+    close = close[np.lexsort((candidates[close], distances[close], sample_ids[close]))]
+    first = close[np.r_[True, sample_ids[close][1:] != sample_ids[close][:-1]]] if len(close) else close
+    edges = np.full(len(samples), -1, dtype=np.int64)
+    fractions = np.zeros(len(samples))
+    edges[sample_ids[first]] = candidates[first]
+    fractions[sample_ids[first]] = t[first]
+    return edges, fractions
+
+# Souvislé shody bodů trasy s jedním úsekem jiné trasy: po sobě jdoucí body mají shodu ve stejném
+# úseku, poloha na úseku se nemění skokem a po ustálení směru se nevrací o víc než 2 tolerance
+# (cesta tam a zpět jsou dvě shody). Vrací seznam (úsek, první bod, poslední bod)
+def matched_runs(spans, source_arcs, sample_arcs, tolerance):
+    runs = []
+    run = None
+    for k, (span, arc, sample_arc) in enumerate(zip(spans.tolist(), source_arcs.tolist(), sample_arcs.tolist())):
+        if run is not None and span == run['span'] and (
+                abs(arc - run['arc']) <= sample_arc - run['sample_arc'] + 2 * tolerance):
+            if run['direction'] == 0 and abs(arc - run['first_arc']) > 2 * tolerance:
+                run['direction'] = 1 if arc > run['first_arc'] else -1
+                run['extreme'] = run['direction'] * arc
+            direction = run['direction']
+            if direction == 0 or direction * arc >= run['extreme'] - 2 * tolerance:
+                run.update(last=k, arc=arc, sample_arc=sample_arc, extreme=max(run['extreme'], direction * arc))
+                continue
+        # Nová shoda (poslední poloha na úseku, směr 0 = zatím neurčený, nejdále dosažená poloha ve směru)
+        run = None
+        if span >= 0:
+            run = {'span': span, 'first': k, 'last': k, 'first_arc': arc, 'arc': arc, 'sample_arc': sample_arc,
+                   'direction': 0, 'extreme': 0.0}
+            runs.append(run)
+    return [(run['span'], run['first'], run['last']) for run in runs]
+
+# Sdílená geometrie: trasy se zpracují postupně a části trasy, které vedou do vzdálenosti
+# SHARED_TOLERANCE podél vlastní geometrie dřívější trasy (duplicitní soubory, opakovaně
+# zaznamenané cesty, i projité opačně), se nahradí odkazem na její body. Odkazované rozsahy se
+# uloží jen jednou jako sdílené úseky; trasy místo 'points' dostanou 'parts', seznam vlastních
+# bodů a čísel sdílených úseků (~číslo = opačný směr). Vrací nové trasy a seznam sdílených úseků
+def share_geometry(routes, tolerance=SHARED_TOLERANCE):
+    coords = [np.asarray(route['points'], dtype=float).reshape(-1, 2) for route in routes]
+    offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+    np.cumsum([len(points) for points in coords], out=offsets[1:])
+    all_coords = np.concatenate(coords) if coords else np.zeros((0, 2))
+    arcs = [route_arc(points) for points in coords]
+    all_arcs = np.concatenate(arcs) if arcs else np.zeros(0)
+
+    # Mřížka hran všech tras (buňky o straně 2 tolerance), hledají se v ní jen hrany s úsekem
+    edge_keys = [np.zeros(0, dtype=np.int64)]
+    edge_ids = [np.zeros(0, dtype=np.int64)]
+    for route_id, (points, arc) in enumerate(zip(coords, arcs)):
+        if len(points) > 1:
+            samples, positions = route_samples(points, arc, tolerance)
+            edges = offsets[route_id] + np.minimum(positions.astype(np.int64), len(points) - 2)
+            pairs = np.unique(np.column_stack([metric_cell_keys(samples, 2 * tolerance)[:, 0], edges]), axis=0)
+            edge_keys.append(pairs[:, 0])
+            edge_ids.append(pairs[:, 1])
+    edge_keys, edge_ids = np.concatenate(edge_keys), np.concatenate(edge_ids)
+    order = np.argsort(edge_keys, kind='stable')
+    edge_keys, edge_ids = edge_keys[order], edge_ids[order]
+    # Úsek = souvislá část trasy uložená vlastními body (trasa, první a poslední bod)
+    edge_span = np.full(len(all_coords), -1, dtype=np.int64)
+    spans = []
+
+    # Náhrady částí tras (první a poslední nahrazený bod, trasa, první a poslední bod zdroje, opačně)
+    replacements = []
+    for route_id, (points, arc) in enumerate(zip(coords, arcs)):
+        route_replacements = []
+        if len(points) > 1 and spans:
+            samples, positions = route_samples(points, arc, tolerance / 2)
+            edges, fractions = nearest_edges(samples, edge_keys, edge_ids, edge_span, all_coords, tolerance)
+            matched = edges >= 0
+            source_arcs = np.where(matched, all_arcs[edges] + fractions * (all_arcs[edges + 1] - all_arcs[edges]), 0.0)
+            sample_arcs = np.interp(positions, np.arange(len(points)), arc)
+            vertex_samples = np.searchsorted(positions, np.arange(len(points)))
+            for span, first, last in matched_runs(np.where(matched, edge_span[edges], -1), source_arcs, sample_arcs,
+                                                  tolerance):
+                # Nahradí se body trasy uvnitř shody zdrojovými body mezi průměty krajních z nich
+                start = np.searchsorted(vertex_samples, first)
+                end = np.searchsorted(vertex_samples, last, 'right') - 1
+                if end < start:
+                    continue
+                source, span_start, span_end = spans[span]
+                begin, finish = (edges[vertex_samples[[start, end]]] - offsets[source]
+                                 + fractions[vertex_samples[[start, end]]]).tolist()
+                reverse = finish < begin
+                low, high = sorted([begin, finish])
+                low, high = max(int(np.ceil(low - 1e-9)), span_start), min(int(np.floor(high + 1e-9)), span_end)
+                if high > low and arcs[source][high] - arcs[source][low] >= SHARED_MIN_LENGTH:
+                    route_replacements.append((int(start), int(end), source, low, high, reverse))
+        replacements.append(route_replacements)
+
+        # Zbytek trasy tvoří úseky, na které mohou odkazovat další trasy
+        inline_start = 0
+        for start, end, *_ in route_replacements + [(len(points), len(points))]:
+            if start - 1 > inline_start:
+                edge_span[offsets[route_id] + inline_start:offsets[route_id] + start - 1] = len(spans)
+                spans.append((route_id, inline_start, start - 1))
+            inline_start = end + 1
+
+    # Hranice sdílených úseků v trasách, na které se odkazuje, a čísla úseků v pořadí výskytu
+    cuts = [set() for _ in routes]
+    covered = [np.zeros(len(points) + 1, dtype=np.int64) for points in coords]
+    for route_replacements in replacements:
+        for _, _, source, low, high, _ in route_replacements:
+            cuts[source].update((low, high + 1))
+            covered[source][low] += 1
+            covered[source][high + 1] -= 1
+    cuts = [sorted(route_cuts) for route_cuts in cuts]
+    shared_ids = {}
+    shared = []
+    shared_routes = []
+    for route_id, (route, points) in enumerate(zip(routes, coords)):
+        coverage = np.cumsum(covered[route_id]) > 0
+        parts = []
+
+        def add_points(start, end):
+            if end > start:
+                if parts and not isinstance(parts[-1], int):
+                    parts[-1].extend(points[start:end].tolist())
+                else:
+                    parts.append(points[start:end].tolist())
+
+        inline_start = 0
+        for start, end, source, low, high, reverse in replacements[route_id] + [(len(points), 0, 0, 0, -1, False)]:
+            # Vlastní body rozdělené na hranicích sdílených úseků
+            bounds = [inline_start] + [cut for cut in cuts[route_id] if inline_start < cut < start] + [start]
+            for piece_start, piece_end in zip(bounds[:-1], bounds[1:]):
+                if piece_end > piece_start and coverage[piece_start]:
+                    shared_ids[route_id, piece_start] = len(shared)
+                    parts.append(len(shared))
+                    shared.append(points[piece_start:piece_end].tolist())
+                else:
+                    add_points(piece_start, piece_end)
+            # Odkaz na úseky zdrojové trasy mezi low a high
+            ids = [shared_ids[source, cut] for cut in cuts[source] if low <= cut <= high]
+            parts.extend([~shared_id for shared_id in reversed(ids)] if reverse else ids)
+            inline_start = max(end + 1, start)
+        shared_routes.append(dict(parts=parts, **{key: value for key, value in route.items() if key != 'points'}))
+
+    # Úspora bodů a soubory, jejichž trasy jsou přesnou kopií jiného souboru
+    total = len(all_coords)
+    stored = sum(len(path) for path in shared) + sum(
+        len(part) for route in shared_routes for part in route['parts'] if not isinstance(part, int))
+    trip_hashes = defaultdict(hashlib.sha1)
+    trip_titles = {}
+    for route, points in zip(routes, coords):
+        trip_hashes[route['trip']].update(points.tobytes())
+        trip_titles[route['trip']] = f"{route['title']} ({route['date']})"
+    first_trips = {}
+    for trip, digest in trip_hashes.items():
+        original = first_trips.setdefault(digest.digest(), trip)
+        if original != trip:
+            print(f'Duplicitní soubor: {trip_titles[trip]} = {trip_titles[original]}')
+    saved = 1 - stored / total if total else 0.0
+    print(f'Sdílené úseky: {len(shared)} úseků, {len(trip_hashes) - len(first_trips)} duplicitních souborů, '
+          f'{total} -> {stored} bodů (ušetřeno {saved:.1%})')
+    return shared_routes, shared
+
+# Web Mercator (x = délka, y = šířka v radiánech po projekci), v něm Leaflet obrázek roztahuje
+def mercator(coords):
+    coords = np.radians(coords)
+    return np.column_stack([coords[:, 1], np.log(np.tan(np.pi / 4 + coords[:, 0] / 2))])
+
+# Body úseků tras po nejvýše jednom pixelu (pixels jsou souřadnice bodů v pixelech, route_ids
+# trasa každého bodu); úsek i vede z bodu i do bodu i + 1 téže trasy, k bodům úseků se přidají
+# i samotné body tras. Vrací body a jejich trasy
+def sample_segments(pixels, route_ids):
+    starts = np.flatnonzero(route_ids[1:] == route_ids[:-1])
+    deltas = pixels[starts + 1] - pixels[starts]
+    steps = np.ceil(np.abs(deltas).max(axis=1)).astype(np.int64) + 1
+    samples, edges, _ = densify_edges(pixels[starts], deltas, steps)
+    samples = np.vstack([samples, pixels])
+    return samples, np.concatenate([route_ids[starts][edges], route_ids])
+
+# Hustota tras v mřížce width x height pixelů nad ohraničením [[jih, západ], [sever, východ]]:
+# úseky všech tras se najednou navzorkují po nejvýše jednom pixelu a každá trasa se
+# v pixelu počítá jen jednou; vrací počty tras v pixelech (první řádek je sever)
+def rasterize_routes(routes, bounds, width, height):
+    lengths = np.array([len(route['points']) for route in routes], dtype=np.int64)
+    coords = np.concatenate([np.asarray(route['points'], dtype=float).reshape(-1, 2) for route in routes])
+    route_ids = np.repeat(np.arange(len(routes)), lengths)
+
+    (x0, y0), (x1, y1) = mercator(np.array(bounds, dtype=float))
+    xy = mercator(coords)
+    pixels = np.column_stack([(xy[:, 0] - x0) / (x1 - x0) * width, (y1 - xy[:, 1]) / (y1 - y0) * height])
+    samples, sample_routes = sample_segments(pixels, route_ids)
+
+    columns = np.clip(np.floor(samples[:, 0]).astype(np.int64), 0, width - 1)
+    rows = np.clip(np.floor(samples[:, 1]).astype(np.int64), 0, height - 1)
+    keys = np.unique(sample_routes * (width * height) + rows * width + columns)
+    return np.bincount(keys % (width * height), minlength=width * height).reshape(height, width)
+
+# Obrázek RGBA z počtů tras: logaritmická stupnice barev HEATMAP_COLORS, prázdné pixely průhledné
+def heatmap_image(counts):
+    intensity = np.log1p(counts) / np.log1p(max(counts.max(), 1))
+    stops = np.linspace(0, 1, len(HEATMAP_COLORS))
+    rgba = np.zeros(counts.shape + (4,), dtype=np.uint8)
+    for channel in range(3):
+        rgba[..., channel] = np.interp(intensity, stops, [color[channel] for color in HEATMAP_COLORS])
+    rgba[..., 3] = 110 + 145 * intensity
+    rgba[counts == 0] = 0
+    return rgba
+
+# PNG (RGBA, 8 bitů na kanál) bez dalších knihoven: řádky bez filtru komprimované zlibem
+def encode_png(rgba):
+    height, width = rgba.shape[:2]
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 9)) + chunk(b'IEND', b''))
+
+# Heatmapa všech tras jako PNG s world filem (.pgw, souřadnice EPSG:3857) pro GIS;
+# vrací adresu obrázku, ohraničení a zoom pro stránku, None pokud trasy nemají body
+def write_heatmap(routes, path, size=HEATMAP_SIZE):
+    routes = [route for route in routes if len(route['points'])]
+    if not routes:
+        return None
+    bounds = np.array([route['bounds'] for route in routes], dtype=float)
+    south_west, north_east = bounds[:, 0].min(axis=0), bounds[:, 1].max(axis=0)
+    # Jediný bod by dal nulové rozměry
+    north_east = np.maximum(north_east, south_west + 1e-5)
+    bounds = [south_west.tolist(), north_east.tolist()]
+
+    (x0, y0), (x1, y1) = mercator(np.array(bounds))
+    scale = size / max(x1 - x0, y1 - y0)
+    width, height = max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale))
+    write_bytes_if_changed(path, encode_png(heatmap_image(rasterize_routes(routes, bounds, width, height))))
+
+    pixel_x = (x1 - x0) / width * MERCATOR_RADIUS
+    pixel_y = (y1 - y0) / height * MERCATOR_RADIUS
+    world_file = [pixel_x, 0.0, 0.0, -pixel_y, x0 * MERCATOR_RADIUS + pixel_x / 2, y1 * MERCATOR_RADIUS - pixel_y / 2]
+    write_if_changed(os.path.splitext(path)[0] + '.pgw', ''.join(f'{float(value)!r}\n' for value in world_file))
+    return {'url': path.replace(os.sep, '/'), 'bounds': bounds, 'maxZoom': HEATMAP_MAX_ZOOM}
+
+# Vykreslení jedné dlaždice: pixely čar (index řádek * TILE_SIZE + sloupec) v barvě roku
+def render_tile(task):
+    path, pixels, color = task
+    rgba = np.zeros((TILE_SIZE * TILE_SIZE, 4), dtype=np.uint8)
+    rgba[pixels] = color + (255,)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_bytes_if_changed(path, encode_png(rgba.reshape(TILE_SIZE, TILE_SIZE, 4)))
+
+# Předem vykreslené dlaždice tras {rok}/{z}/{x}/{y}.png pro zoomy TILE_ZOOMS, každý rok zvlášť
+# (stránka je pak přepíná spolu s roky). Čáry všech tras roku se pro každý zoom navzorkují
+# najednou; dlaždice se vykreslí v procesech jen pokud se její pixely od minulého běhu
+# změnily (hash pixelů v tiles.json), dlaždice bez tras se smažou.
+# Vrací nastavení vrstvy pro stránku, None pokud trasy nemají body
+def write_tiles(routes, directory, zooms=TILE_ZOOMS, workers=1):
+    manifest_file = os.path.join(directory, 'tiles.json')
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as file:
+            previous = json.load(file)
+    except (OSError, ValueError):
+        previous = {}
+
+    hashes = {}
+    tasks = []
+    year_bounds = {}
+    for year, color in route_years(routes):
+        year_routes = [route for route in routes if route['year'] == year and len(route['points'])]
+        if not year_routes:
+            continue
+        bounds = np.array([route['bounds'] for route in year_routes], dtype=float)
+        year_bounds[year] = [bounds[:, 0].min(axis=0).tolist(), bounds[:, 1].max(axis=0).tolist()]
+        lengths = np.array([len(route['points']) for route in year_routes], dtype=np.int64)
+        xy = mercator(np.concatenate([np.asarray(route['points'], dtype=float).reshape(-1, 2)
+                                      for route in year_routes]))
+        route_ids = np.repeat(np.arange(len(year_routes)), lengths)
+        rgb = tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+        for zoom in zooms:
+            tiles_per_side = 2 ** zoom
+            size = TILE_SIZE * tiles_per_side
+            pixels = np.column_stack([(xy[:, 0] / np.pi + 1) / 2 * size, (1 - xy[:, 1] / np.pi) / 2 * size])
+            samples, _ = sample_segments(pixels, route_ids)
+            cells = np.floor(samples).astype(np.int64)
+            # Čára široká dva pixely
+            cells = np.clip(np.vstack([cells + offset for offset in ((0, 0), (1, 0), (0, 1), (1, 1))]), 0, size - 1)
+            tiles = (cells[:, 0] // TILE_SIZE) * tiles_per_side + cells[:, 1] // TILE_SIZE
+            local = (cells[:, 1] % TILE_SIZE) * TILE_SIZE + cells[:, 0] % TILE_SIZE
+            keys = np.unique(tiles * TILE_SIZE * TILE_SIZE + local)
+            tile_ids = keys // (TILE_SIZE * TILE_SIZE)
+            starts = np.flatnonzero(np.r_[True, tile_ids[1:] != tile_ids[:-1]])
+            for tile, tile_pixels in zip(tile_ids[starts].tolist(), np.split(keys % (TILE_SIZE * TILE_SIZE), starts[1:])):
+                x, y = divmod(tile, tiles_per_side)
+                name = f'{year}/{zoom}/{x}/{y}.png'
+                tile_pixels = tile_pixels.astype(np.uint16)
+                hashes[name] = hashlib.sha1(color.encode('ascii') + tile_pixels.tobytes()).hexdigest()
+                path = os.path.join(directory, *name.split('/'))
+                if previous.get(name) != hashes[name] or not os.path.exists(path):
+                    tasks.append((path, tile_pixels, rgb))
+
+    if workers > 1 and len(tasks) > 1:
+        workers = min(workers, len(tasks))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render_tile, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        for task in tasks:
+            render_tile(task)
+
+    stale = [name for name in previous if name not in hashes]
+    for name in stale:
+        try:
+            os.remove(os.path.join(directory, *name.split('/')))
+        except OSError:
+            pass
+    os.makedirs(directory, exist_ok=True)
+    write_if_changed(manifest_file, json.dumps(hashes, indent=0))
+    print(f'Dlaždice tras: {len(tasks)} vykresleno, {len(hashes) - len(tasks)} beze změny, {len(stale)} smazáno')
+
+    if not year_bounds:
+        return None
+    return {
+        'url': directory.replace(os.sep, '/') + '/{year}/{z}/{x}/{y}.png',
+        'minZoom': min(zooms),
+        'maxZoom': max(zooms),
+        'bounds': year_bounds,
+    }
+
+# Statistiky všech segmentů najednou: body se spojí do jednoho pole a součty
+# po segmentech se počítají přes bincount, úseky mezi segmenty se vynechají
+# Výšky vyhlazené průměrem bodů do vzdálenosti ELEVATION_SMOOTHING po trase v rámci segmentu
+# (distances jsou délky úseků mezi body); body bez výšky zůstávají NaN
+def smooth_elevations(elevations, distances, segment_ids, radius=ELEVATION_SMOOTHING):
+    # Poloha bodů po trase, segmenty se od sebe oddálí, aby se okna nepřekrývala
+    along = np.concatenate([[0.0], np.cumsum(distances)]) + segment_ids * (2 * radius + 1)
+    start = np.searchsorted(along, along - radius, 'left')
+    end = np.searchsorted(along, along + radius, 'right')
+    known = ~np.isnan(elevations)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(known, elevations, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(known)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(known, (sums[end] - sums[start]) / (counts[end] - counts[start]), np.nan)
+
+def calculate_statistics(segments):
+    lengths = np.array([len(segment['points']) for segment in segments], dtype=np.int64)
+    total = int(lengths.sum())
+    segment_ids = np.repeat(np.arange(len(segments)), lengths)
+    if total > 1:
+        # Po segmentech, body mohou být seznamy i pole (segmenty z archivu), None v seznamech je NaN
+        coords = np.radians(np.concatenate(
+            [np.asarray(segment['points'], dtype=float).reshape(-1, 2) for segment in segments]))
+        elevations = np.concatenate([np.asarray(segment['elevations'], dtype=float) for segment in segments])
+        times = np.concatenate([np.asarray(segment['times'], dtype=float) for segment in segments])
+    else:
+        coords, elevations, times = np.zeros((total, 2)), np.zeros(total), np.zeros(total)
+
+    # Úsek i vede z bodu i do bodu i + 1, poslední bod segmentu žádný úsek nezačíná
+    valid = np.ones(max(total - 1, 0), dtype=bool)
+    ends = np.cumsum(lengths)
+    ends = ends[(ends > 0) & (ends < total)]
+    valid[ends - 1] = False
+    edge_segments = segment_ids[:-1]
+
+    lat, lon = coords[:, 0], coords[:, 1]
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    distances = np.where(valid, 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a)), 0.0)
+    climbs = np.where(valid, np.diff(smooth_elevations(elevations, distances, segment_ids)), np.nan)
+    durations = np.where(valid, np.diff(times), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moving = (durations > 0) & (distances / durations >= MOVING_SPEED)
+
+    def per_segment(values):
+        return np.bincount(edge_segments, weights=np.nan_to_num(values), minlength=len(segments))
+
+    distance = per_segment(distances)
+    ascent = per_segment(np.where(climbs > 0, climbs, 0.0))
+    descent = per_segment(np.where(climbs < 0, -climbs, 0.0))
+    duration = per_segment(np.where(durations > 0, durations, 0.0))
+    moving_time = per_segment(np.where(moving, durations, 0.0))
+    moving_distance = per_segment(np.where(moving, distances, 0.0))
+
+    statistics = []
+    for i in range(len(segments)):
+        statistics.append({
+            'distance': round(float(distance[i])),
+            'ascent': round(float(ascent[i])),
+            'descent': round(float(descent[i])),
+            'duration': round(float(duration[i])),
+            'moving_time': round(float(moving_time[i])),
+            'moving_distance': round(float(moving_distance[i])),
+            # průměrná rychlost v pohybu v km/h
+            'speed': round(float(moving_distance[i] / moving_time[i] * 3.6), 1) if moving_time[i] > 0 else None,
+        })
+    return statistics
+
+# Souhrn statistik po výpravách (souborech) pro další zpracování; soubor výpravy je cesta
+# relativně k adresáři s GPX soubory (názvy v různých podadresářích se mohou opakovat)
+def write_statistics(routes, gpx_files, path, directory='gpx'):
+    trips = []
+    for trip_id, (gpx_file, file_date, title) in enumerate(gpx_files):
+        segments = [route['stats'] for route in routes if route['trip'] == trip_id]
+        totals = {key: sum(stats[key] for stats in segments)
+                  for key in ('distance', 'ascent', 'descent', 'duration', 'moving_time', 'moving_distance')}
+        moving_time = totals['moving_time']
+        totals['speed'] = round(totals['moving_distance'] / moving_time * 3.6, 1) if moving_time > 0 else None
+        trips.append({
+            'file': os.path.relpath(gpx_file, directory).replace(os.sep, '/'),
+            'title': title,
+            'date': file_date.strftime('%Y-%m-%d'),
+            'segments': segments,
+            **totals,
+        })
+    write_if_changed(path, json.dumps(trips, ensure_ascii=False, indent=4))
+
+# Atomický zápis souboru (přes dočasný soubor), jen pokud se obsah změnil
+def write_if_changed(path, content):
+    return write_chunks_if_changed(path, [content])
+
+# Zápis obsahu po částech (celý obsah se v paměti nedrží) přes dočasný soubor,
+# který nahradí původní soubor jen pokud se obsah liší
+def write_chunks_if_changed(path, chunks):
+    temp_path = path + '.tmp'
+    write_chunks(temp_path, chunks)
+    if files_equal(temp_path, path):
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
+
+# Zápis částí textu do souboru, s digest se zároveň počítá hash obsahu
+def write_chunks(path, chunks, digest=None):
+    with open(path, 'w', encoding='utf-8') as file:
+        for chunk in chunks:
+            file.write(chunk)
+            if digest is not None:
+                digest.update(chunk.encode('utf-8'))
+
+# Porovnání obsahu dvou souborů po blocích
+def files_equal(path, other):
+    try:
+        if os.path.getsize(path) != os.path.getsize(other):
+            return False
+        with open(path, 'rb') as file, open(other, 'rb') as other_file:
+            while True:
+                block = file.read(1 << 16)
+                if block != other_file.read(1 << 16):
+                    return False
+                if not block:
+                    return True
+    except OSError:
+        return False
+
+def write_bytes_if_changed(path, content):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(content)
+    if files_equal(temp_path, path):
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
+
+# Načtení segmentů (body, výšky, časy a střed) z jednoho GPX souboru
+def parse_gpx_file(gpx_file):
+    try:
+        segments = list(iter_gpx_segments(gpx_file))
+    except (ET.ParseError, KeyError, ValueError):
+        segments = list(iter_gpx_segments_gpxpy(gpx_file))
+    return [
+        {'points': points, 'elevations': elevations, 'times': times, 'center': calculate_center(points)}
+        for points, elevations, times in segments
+    ]
+
+# Otevření mezipaměti, klíčem je cesta, velikost, čas změny a hash obsahu souboru
+def open_cache(cache_file):
+    cache = sqlite3.connect(cache_file)
+    if cache.execute('PRAGMA user_version').fetchone()[0] != CACHE_VERSION:
+        cache.execute('DROP TABLE IF EXISTS gpx')
+        cache.execute(f'PRAGMA user_version = {CACHE_VERSION}')
+    cache.execute("""CREATE TABLE IF NOT EXISTS gpx (
+        path TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        sha1 TEXT NOT NULL,
+        segments TEXT NOT NULL
+    )""")
+    return cache
+
+def file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+# Velikost a čas změny souboru, s indexem ze scan_gpx_files z něj (soubor se znovu nestatuje)
+def file_stat(path, index=None):
+    if index is not None:
+        entry = index['files'][path]
+        return entry['size'], entry['mtime_ns']
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+# Segmenty GPX souboru z mezipaměti, None pokud se soubor od posledního běhu změnil
+def cached_segments(gpx_file, cache, index=None):
+    size, mtime_ns = file_stat(gpx_file, index)
+    row = cache.execute(
+        'SELECT mtime_ns, size, sha1, segments FROM gpx WHERE path = ?', (gpx_file,)
+    ).fetchone()
+    if row is None or row[1] != size:
+        return None
+    if row[0] == mtime_ns:
+        return json.loads(row[3])
+    # Změnil se jen čas (např. po checkoutu), obsah ověříme hashem
+    if row[2] == file_sha1(gpx_file):
+        cache.execute('UPDATE gpx SET mtime_ns = ? WHERE path = ?', (mtime_ns, gpx_file))
+        return json.loads(row[3])
+    return None
+
+def store_segments(gpx_file, segments, cache, index=None):
+    size, mtime_ns = file_stat(gpx_file, index)
+    cache.execute(
+        'INSERT OR REPLACE INTO gpx (path, mtime_ns, size, sha1, segments) VALUES (?, ?, ?, ?, ?)',
+        (gpx_file, mtime_ns, size, file_sha1(gpx_file), json.dumps(segments)),
+    )
+
+# Načtení segmentů všech souborů, nezměněné z mezipaměti, ostatní paralelně v procesech;
+# velikosti a časy změny souborů se s indexem ze scan_gpx_files berou z něj
+def load_segments(gpx_files, cache=None, workers=1, index=None):
+    paths = [gpx_file for gpx_file, _, _ in gpx_files]
+    segments = {}
+    if cache is not None:
+        for path in paths:
+            cached = cached_segments(path, cache, index)
+            if cached is not None:
+                segments[path] = cached
+    missing = [path for path in paths if path not in segments]
+
+    if workers > 1 and len(missing) > 1:
+        workers = min(workers, len(missing))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(missing) // (workers * 4))
+            parsed = list(executor.map(parse_gpx_file, missing, chunksize=chunksize))
+    else:
+        parsed = [parse_gpx_file(path) for path in missing]
+
+    for path, path_segments in zip(missing, parsed):
+        segments[path] = path_segments
+        if cache is not None:
+            store_segments(path, path_segments, cache, index)
+    return segments
+
+# Odstranění záznamů pro smazané soubory
+def evict_cache(cache, gpx_files):
+    existing = {gpx_file for gpx_file, _, _ in gpx_files}
+    stale = [path for (path,) in cache.execute('SELECT path FROM gpx') if path not in existing]
+    cache.executemany('DELETE FROM gpx WHERE path = ?', [(path,) for path in stale])
+    return len(stale)
+
+# Nastavení, se kterým jsou sestavené trasy v archivu (tolerance zjednodušení a úrovně detailu)
+def archive_settings(tolerance, lod_tiers):
+    return [tolerance, [list(tier) for tier in lod_tiers] if lod_tiers else None]
+
+# Zápis částí (body, výšky nebo časy jednotlivých segmentů) za sebou do jednoho pole .npy;
+# pole se plní přímo v souboru (open_memmap). Vrací tabulku začátků částí
+def save_columns(path, parts, shape=()):
+    offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+    np.cumsum([len(part) for part in parts], out=offsets[1:])
+    columns = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(int(offsets[-1]),) + shape)
+    for part, start, end in zip(parts, offsets[:-1], offsets[1:]):
+        columns[start:end] = np.asarray(part, dtype=float).reshape((-1,) + shape)
+    columns.flush()
+    del columns
+    return offsets
+
+# Pole archivu se zapisují vždy do nového podadresáře (generace g1, g2, ...), protože soubory
+# předchozí generace mohou být ještě namapované z načteného archivu a trasy na ně odkazují;
+# na Windows takové soubory nelze přepsat, nahradit ani smazat
+def next_archive_generation(directory):
+    generations = [int(name[1:]) for name in os.listdir(directory) if name[:1] == 'g' and name[1:].isdigit()]
+    return f'g{max(generations, default=0) + 1}'
+
+# Smazání starších generací archivu; soubory, které jsou ještě namapované, se smažou při dalším zápisu
+def remove_archive_generations(directory, current):
+    for name in os.listdir(directory):
+        if name != current and name[:1] == 'g' and name[1:].isdigit():
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+# Uložení do sloupcového archivu po souborech: původní segmenty (body, výšky a časy, chybějící
+# hodnoty jako NaN) a sestavené trasy (zjednodušené body, úrovně detailu), vždy všechny hodnoty
+# v jednom poli float64 s tabulkou začátků. V routes.json je pro každý soubor velikost, čas změny
+# a rozsah jeho segmentů (každý segment je jedna trasa), generace s poli, nastavení sestavení
+# a metadata tras. Metadata se zapisují poslední, takže nedokončený zápis se při příštím načtení
+# nepoužije
+def write_archive(directory, gpx_files, index, segments, file_routes, settings):
+    os.makedirs(directory, exist_ok=True)
+    metadata_file = os.path.join(directory, 'routes.json')
+    if os.path.exists(metadata_file):
+        os.remove(metadata_file)
+    generation = next_archive_generation(directory)
+    array_directory = os.path.join(directory, generation)
+    os.makedirs(array_directory)
+
+    paths = [gpx_file for gpx_file, _, _ in gpx_files]
+    all_segments = [segment for path in paths for segment in segments[path]]
+    routes = [route for path in paths for route in file_routes[path]]
+    offsets = save_columns(os.path.join(array_directory, 'segment_coords.npy'),
+                           [segment['points'] for segment in all_segments], (2,))
+    save_columns(os.path.join(array_directory, 'segment_elevations.npy'), [segment['elevations'] for segment in all_segments])
+    save_columns(os.path.join(array_directory, 'segment_times.npy'), [segment['times'] for segment in all_segments])
+    np.save(os.path.join(array_directory, 'segment_offsets.npy'), offsets)
+    offsets = save_columns(os.path.join(array_directory, 'coords.npy'), [route['points'] for route in routes], (2,))
+    np.save(os.path.join(array_directory, 'offsets.npy'), offsets)
+    # Úrovně detailu v pořadí trasa po trase
+    tier_points = [points for route in routes for _, points in route['tiers']] if settings[1] else []
+    offsets = save_columns(os.path.join(array_directory, 'tier_coords.npy'), tier_points, (2,))
+    np.save(os.path.join(array_directory, 'tier_offsets.npy'), offsets)
+
+    files = {}
+    first = 0
+    for path in paths:
+        entry = index['files'][path]
+        files[path] = {'size': entry['size'], 'mtime_ns': entry['mtime_ns'],
+                       'segments': [first, first + len(segments[path])]}
+        first += len(segments[path])
+    metadata = {
+        'version': ARCHIVE_VERSION,
+        'generation': generation,
+        'settings': settings,
+        'files': files,
+        'routes': [{key: value for key, value in route.items() if key not in ('points', 'tiers')} for route in routes],
+    }
+    write_if_changed(metadata_file, json.dumps(metadata, ensure_ascii=False, default=json_default))
+    remove_archive_generations(directory, generation)
+
+# Načtení archivu: metadata a pole namapovaná do paměti (np.load s mmap_mode), takže se data
+# při načtení nekopírují. None pokud archiv chybí, není úplný nebo má jinou verzi
+def load_archive(directory):
+    try:
+        with open(os.path.join(directory, 'routes.json'), 'r', encoding='utf-8') as file:
+            archive = json.load(file)
+        if archive.get('version') != ARCHIVE_VERSION:
+            return None
+        array_directory = os.path.join(directory, archive['generation'])
+        for name in ('segment_coords', 'segment_elevations', 'segment_times', 'coords', 'tier_coords'):
+            archive[name] = np.load(os.path.join(array_directory, f'{name}.npy'), mmap_mode='r')
+        for name in ('segment_offsets', 'offsets', 'tier_offsets'):
+            archive[name] = np.load(os.path.join(array_directory, f'{name}.npy'))
+    except (OSError, ValueError):
         return None
-    latitudes = [point[0] for point in points]
-    longitudes = [point[1] for point in points]
-    center_lat = sum(latitudes) / len(latitudes)
-    center_lon = sum(longitudes) / len(longitudes)
-    return (center_lat, center_lon)
+    return archive
+
+# Rozsahy segmentů v archivu pro soubory, které se od zápisu archivu nezměnily (velikost a čas
+# změny podle indexu ze scan_gpx_files, soubory se znovu nestatují)
+def archived_files(archive, index):
+    unchanged = {}
+    for path, entry in archive['files'].items():
+        current = index['files'].get(path)
+        if current is not None and (current['size'], current['mtime_ns']) == (entry['size'], entry['mtime_ns']):
+            unchanged[path] = range(*entry['segments'])
+    return unchanged
+
+# Původní segmenty nezměněných souborů z archivu, body, výšky a časy jsou pohledy do polí archivu
+def archived_segments(archive, index):
+    offsets = archive['segment_offsets']
+    segments = {}
+    for path, segment_ids in archived_files(archive, index).items():
+        segments[path] = []
+        for segment_id in segment_ids:
+            start, end = offsets[segment_id], offsets[segment_id + 1]
+            points = archive['segment_coords'][start:end]
+            segments[path].append({
+                'points': points,
+                'elevations': archive['segment_elevations'][start:end],
+                'times': archive['segment_times'][start:end],
+                'center': calculate_center(points),
+            })
+    return segments
+
+# Sestavené trasy nezměněných souborů z archivu (cesta -> trasy), jen pokud byly sestaveny
+# se stejným nastavením; body jsou pohledy do polí archivu
+def archived_routes(archive, index, settings):
+    if archive['settings'] != settings:
+        return {}
+    coords, offsets = archive['coords'], archive['offsets']
+    tier_coords, tier_offsets = archive['tier_coords'], archive['tier_offsets']
+    tier_zooms = [max_zoom for max_zoom, _ in settings[1] or []]
+    file_routes = {}
+    for path, route_ids in archived_files(archive, index).items():
+        file_routes[path] = []
+        for route_id in route_ids:
+            # Pořadí klíčů jako u build_routes, výstup je pak shodný
+            route = {'points': coords[offsets[route_id]:offsets[route_id + 1]], **archive['routes'][route_id]}
+            if tier_zooms:
+                first = route_id * len(tier_zooms)
+                route['tiers'] = [
+                    [max_zoom, tier_coords[tier_offsets[first + i]:tier_offsets[first + i + 1]]]
+                    for i, max_zoom in enumerate(tier_zooms)
+                ]
+            file_routes[path].append(route)
+    return file_routes
 
 # GPX na mapu
-def add_gpx_to_map(gpx_files, map_obj):
+def add_gpx_to_map(gpx_files, cache=None, workers=1, tolerance=SIMPLIFY_TOLERANCE, lod_tiers=None):
+    segments = load_segments(gpx_files, cache, workers)
+    return build_routes(gpx_files, segments, tolerance, lod_tiers)
+
+def year_color(year):
+    return YEAR_COLORS.get(year, YEAR_PALETTE[year % len(YEAR_PALETTE)])
+
+# Roky v datech s barvami tras, od nejnovějšího (pro přepínače a vrstvy stránky)
+def route_years(routes):
+    return sorted({(route['year'], route['color']) for route in routes}, reverse=True)
+
+# Trasy (zjednodušené segmenty s metadaty) z již načtených segmentů souborů
+def build_routes(gpx_files, segments, tolerance=SIMPLIFY_TOLERANCE, lod_tiers=None):
+    routes = []
+    # Statistiky z původních (nezjednodušených) bodů všech segmentů najednou
+    statistics = iter(calculate_statistics([segment for gpx_file, _, _ in gpx_files for segment in segments[gpx_file]]))
+    points_before = points_after = 0
+    for trip_id, (gpx_file, file_date, title) in enumerate(gpx_files):
+        for segment in segments[gpx_file]:
+            # Střed se počítá z původních bodů, do mapy jde zjednodušená trasa
+            points = simplify_points(segment['points'], tolerance)
+            center = segment['center']
+            points_before += len(segment['points'])
+            points_after += len(points)
+            # Uložení do seznamu
+            routes.append({
+                'points': points,
+                'title': title,
+                'date': file_date.strftime('%d.%m.%Y'),
+                'day': file_date.toordinal(),
+                'center': center,
+                'bounds': calculate_bounds(segment['points']),
+                'trip': trip_id,
+                'year': file_date.year,
+                'color': year_color(file_date.year),
+                'stats': next(statistics),
+            })
+            # Hrubší verze trasy pro nižší zoom
+            if lod_tiers:
+                routes[-1]['tiers'] = [
+                    [max_zoom, simplify_points(points, tier_tolerance)] for max_zoom, tier_tolerance in lod_tiers
+                ]
+    if tolerance > 0:
+        print(f'Zjednodušení tras (tolerance {tolerance} m): {points_before} -> {points_after} bodů')
+    return routes
+
+# Trasy po souborech (cesta -> trasy) z již načtených segmentů
+def build_file_routes(gpx_files, segments, tolerance=SIMPLIFY_TOLERANCE, lod_tiers=None):
+    file_routes = {gpx_file: [] for gpx_file, _, _ in gpx_files}
+    if gpx_files:
+        for route in build_routes(gpx_files, segments, tolerance, lod_tiers):
+            file_routes[gpx_files[route['trip']][0]].append(route)
+    return file_routes
+
+# Spojení tras souborů v pořadí souborů, čísla výprav odpovídají pořadí
+def merge_file_routes(gpx_files, file_routes):
     routes = []
-    for gpx_file, file_date, title in gpx_files:
-        with open(gpx_file, 'r') as f:
-            gpx = gpxpy.parse(f)
-            for track in gpx.tracks:
-                for segment in track.segments:
-                    points = [(point.latitude, point.longitude) for point in segment.points]
-                    center = calculate_center(points)
-                    color = '#000000'
-                    if file_date.year == 2024:
-                        color = '#FF0000'
-                    elif file_date.year == 2023:
-                        color = '#0000FF'
-                    elif file_date.year == 2025:
-                        color = '#008000'
-                    # Přidání polyline na mapu
-                    folium.PolyLine(
-                        points,
-                        color=color,
-                        popup=f"<b>{title}</b><br>{file_date.strftime('%d.%m.%Y')}",
-                    ).add_to(map_obj)
-                    # Uložení do seznamu
-                    routes.append({
-                        'points': points,
-                        'title': title,
-                        'date': file_date.strftime('%d.%m.%Y'),
-                        'center': center,
-                        'year': file_date.year,
-                        'color': color
-                    })
+    for trip_id, (gpx_file, _, _) in enumerate(gpx_files):
+        for route in file_routes[gpx_file]:
+            route['trip'] = trip_id
+            routes.append(route)
     return routes
 
+# Seznam výprav pro panel: po sobě jdoucí dny na stejném místě se spojí do rozmezí.
+# Dny se zpracovávají jako ordinální čísla, na text se převádějí až ve výstupu
 def group_routes(routes):
-    grouped = defaultdict(list)
-
-    # Skupinování tras podle místa a dat
+    # Místa v pořadí prvního výskytu, záznamy (místo, den, délka) seřazené jedním řazením
+    place_order = {}
+    entries = []
     for route in routes:
-        place = route["title"]
-        # Ošetření datumu s možností rozmezí
-        date_str = route["date"]
-        dates = []
-        if '–' in date_str:  # Zkontroluj, zda je v datu rozmezí
-            start_date_str, end_date_str = date_str.split('–')
-            start_date = datetime.strptime(start_date_str.strip(), '%d.%m.%Y')
-            end_date = datetime.strptime(end_date_str.strip(), '%d.%m.%Y')
-            dates.append(start_date)
-            dates.append(end_date)
+        order = place_order.setdefault(route['title'], len(place_order))
+        entries.append((order, route['day'], route.get('stats', {}).get('distance', 0)))
+    entries.sort()
+    places = list(place_order)
+
+    # Průchod seřazenými záznamy, po sobě jdoucí dny jednoho místa tvoří jeden úsek
+    runs = []
+    for order, day, distance in entries:
+        if runs and runs[-1][0] == order and day - runs[-1][2] == 1:
+            runs[-1][2] = day
+            runs[-1][3] += distance
         else:
-            date = datetime.strptime(date_str, '%d.%m.%Y')
-            dates.append(date)
+            runs.append([order, day, day, distance])
 
-        for date in dates:
-            grouped[place].append(date)
+    # Řazení podle posledního dne (stabilní, v rámci dne zůstává pořadí míst)
+    runs.sort(key=lambda run: run[2])
 
-    # Příprava seznamu pro zobrazení
     display_routes = []
-    for place, dates in grouped.items():
-        dates.sort()  # Řazení dat
-        # Skupinování po sobě jdoucích dat
-        start_date = dates[0]
-        end_date = start_date
-
-        for current_date in dates[1:]:
-            if (current_date - end_date).days == 1:  # Kontrola, zda jsou data za sebou
-                end_date = current_date
-            else:
-                if start_date == end_date:
-                    display_routes.append({
-                        "place": place,
-                        "date": start_date.strftime('%d.%m.%Y')
-                    })
-                else:
-                    display_routes.append({
-                        "place": place,
-                        "date": f"{start_date.strftime('%d.%m.%Y')} – {end_date.strftime('%d.%m.%Y')}"
-                    })
-                start_date = current_date
-                end_date = current_date
-
-        # Přidání posledního rozsahu
-        if start_date == end_date:
-            display_routes.append({
-                "place": place,
-                "date": start_date.strftime('%d.%m.%Y')
-            })
+    for order, start_day, end_day, distance in runs:
+        date = format_day(start_day)
+        if end_day != start_day:
+            date = f"{date} – {format_day(end_day)}"
+        display_routes.append({
+            "place": places[order],
+            "date": date,
+            "distance": distance
+        })
+    return display_routes
+
+def format_day(day):
+    return date.fromordinal(day).strftime('%d.%m.%Y')
+
+
+# Zakódování bodů do formátu Google encoded polyline (delta kódované celé číslo po 5 bitech)
+def encode_polyline(points, precision=POLYLINE_PRECISION):
+    if len(points) == 0:
+        return ''
+    values = np.round(np.asarray(points, dtype=float) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    zigzag = (deltas << 1) ^ (deltas >> 63)
+    chunks = []
+    for value in zigzag.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+# Data tras pro stránku, v režimu polyline jsou body zakódované do řetězce
+def serialize_routes(routes, encoding='json', precision=POLYLINE_PRECISION):
+    serialized = []
+    for route in routes:
+        # Den jako ordinální číslo slouží jen pro seskupování při sestavení
+        route = {key: value for key, value in route.items() if key != 'day'}
+        if encoding == 'json':
+            serialized.append(route)
+            continue
+        if 'points' in route:
+            route['points'] = encode_polyline(route['points'], precision)
+        if 'parts' in route:
+            route['parts'] = serialize_paths(route['parts'], encoding, precision)
+        if 'tiers' in route:
+            route['tiers'] = [[max_zoom, encode_polyline(points, precision)] for max_zoom, points in route['tiers']]
+        serialized.append(route)
+    return serialized
+
+# Seznam úseků (body nebo odkazy na sdílené úseky), v režimu polyline jsou body zakódované
+def serialize_paths(paths, encoding='json', precision=POLYLINE_PRECISION):
+    if encoding == 'json':
+        return paths
+    return [path if isinstance(path, int) else encode_polyline(path, precision) for path in paths]
+
+# Zápis geometrie každé trasy do samostatného souboru, do stránky jde jen index tras;
+# s hashed_names se soubory jmenují podle hashe obsahu (lze je dlouhodobě cachovat).
+# Trasy s úrovněmi detailu (--lod) mají soubor pro každou úroveň ('files', poslední jsou plné
+# body) a stránka stáhne jen úroveň pro aktuální zoom; s keep_coarse zůstane nejhrubší
+# úroveň přímo ve stránce
+def write_route_files(routes, directory, encoding='json', precision=POLYLINE_PRECISION, hashed_names=False,
+                      keep_coarse=False):
+    os.makedirs(directory, exist_ok=True)
+    index = []
+    written = set()
+
+    def write_geometry(filename, geometry):
+        content = json.dumps(geometry, default=json_default)
+        if hashed_names:
+            filename = content_hash(content) + '.json'
+        write_if_changed(os.path.join(directory, filename), content)
+        written.add(filename)
+        return filename
+
+    for route_id, route in enumerate(serialize_routes(routes, encoding, precision)):
+        tiers = route.pop('tiers', None)
+        geometry = {key: route.pop(key) for key in ('points', 'parts') if key in route}
+        if tiers is None:
+            filename = write_geometry(f'{route_id}.json', geometry)
+            if hashed_names:
+                route['file'] = filename
         else:
-            display_routes.append({
-                "place": place,
-                "date": f"{start_date.strftime('%d.%m.%Y')} – {end_date.strftime('%d.%m.%Y')}"
-            })
+            route['tiers'] = [[max_zoom, None] for max_zoom, _ in tiers]
+            route['files'] = [None] * len(tiers)
+            for level, (_, points) in enumerate(tiers):
+                if keep_coarse and level == 0:
+                    route['tiers'][0][1] = points
+                else:
+                    route['files'][level] = write_geometry(f'{route_id}.{level}.json', {'points': points})
+            route['files'].append(write_geometry(f'{route_id}.json', geometry))
+        index.append(dict(route, id=route_id))
+    remove_stale_files(directory, written, '.json')
+    return index
 
-    # Řazení konečného seznamu podle data
-    display_routes.sort(key=lambda x: datetime.strptime(x['date'].split(' – ')[-1], '%d.%m.%Y'))
+# Soubory s geometrií tras z indexu write_route_files
+def route_files(routes):
+    return [filename for route in routes for filename in route.get('files', [route.get('file')]) if filename]
 
-    return display_routes
+# JSON po částech: seznamy a slovníky do hloubky depth se skládají po prvcích, hlubší hodnoty
+# serializuje json.dumps najednou; výsledek je shodný s json.dumps(value)
+def iter_json(value, depth=1, ensure_ascii=True):
+    if depth > 0 and isinstance(value, list):
+        yield '['
+        for index, item in enumerate(value):
+            if index:
+                yield ', '
+            yield from iter_json(item, depth - 1, ensure_ascii)
+        yield ']'
+    elif depth > 0 and isinstance(value, dict):
+        yield '{'
+        for index, (key, item) in enumerate(value.items()):
+            yield (', ' if index else '') + json.dumps(str(key), ensure_ascii=ensure_ascii) + ': '
+            yield from iter_json(item, depth - 1, ensure_ascii)
+        yield '}'
+    else:
+        yield json.dumps(value, ensure_ascii=ensure_ascii, default=json_default)
+
+# Pole NumPy (body tras z archivu) se do JSON zapisují jako seznamy
+def json_default(value):
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
 
+def content_hash(content):
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
 
+# Smazání souborů (i s komprimovanými variantami) z předchozího sestavení
+def remove_stale_files(directory, written, suffix, prefix=''):
+    for filename in os.listdir(directory):
+        name = filename.removesuffix('.gz').removesuffix('.br')
+        if name.startswith(prefix) and name.endswith(suffix) and name not in written:
+            os.remove(os.path.join(directory, filename))
+
+# Data stránky jako samostatný skript pojmenovaný podle hashe obsahu
+# (zapisuje se po částech a hash se počítá průběžně, soubor se stejným hashem se nepřepisuje)
+def write_data_script(directory, data_for_js, data_routes, routes, spatial_index, search_index, shared_paths=None):
+    os.makedirs(directory, exist_ok=True)
+    data = {
+        'data': data_for_js,
+        'groups': data_routes,
+        'routes': routes,
+        'spatialIndex': spatial_index,
+        'searchIndex': search_index,
+        'sharedPaths': shared_paths,
+    }
+    temp_path = os.path.join(directory, 'mapa-data.tmp')
+    digest = hashlib.sha1()
+    write_chunks(temp_path, chain(['window.mapData = '], iter_json(data, 3, ensure_ascii=False), [';\n']), digest)
+    filename = f'mapa-data.{digest.hexdigest()[:12]}.js'
+    if os.path.exists(os.path.join(directory, filename)):
+        os.remove(temp_path)
+    else:
+        os.replace(temp_path, os.path.join(directory, filename))
+    remove_stale_files(directory, {filename}, '.js', prefix='mapa-data.')
+    return os.path.join(directory, filename)
+
+# Předkomprimované varianty souboru pro statický hosting (gzip vždy, brotli pokud je k dispozici)
+def precompress(path):
+    compressors = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli is not None:
+        compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+    sizes = {'size': os.path.getsize(path)}
+    for suffix, compress in compressors:
+        target = path + suffix
+        # Komprimuje se jen nový nebo změněný soubor
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(path):
+            with open(path, 'rb') as file:
+                compressed = compress(file.read())
+            with open(target + '.tmp', 'wb') as file:
+                file.write(compressed)
+            os.replace(target + '.tmp', target)
+        sizes[suffix.lstrip('.')] = os.path.getsize(target)
+    return sizes
+
+# Komprese všech souborů sestavení, manifest a přehled velikostí
+def write_dist(files, manifest_file):
+    manifest = {path.replace(os.sep, '/'): precompress(path) for path in files}
+    write_if_changed(manifest_file, json.dumps(manifest, indent=4))
+
+    print(f"{'soubory':>24} {'velikost':>12} {'gzip':>12} {'brotli':>12}")
+    groups = defaultdict(list)
+    for path, sizes in manifest.items():
+        groups[os.path.dirname(path) + '/' if os.path.dirname(path) else path].append(sizes)
+    for name, sizes in groups.items():
+        totals = [sum(item.get(key, 0) for item in sizes) for key in ('size', 'gz', 'br')]
+        print(f'{name:>24} ' + ' '.join(f'{total / 1024:>9.1f} kB' if total else f"{'-':>12}" for total in totals))
+
+
+# Místa výprav pro vyhledávání, u každého místa i čísla jeho tras (pořadí v routes)
 def save_routes_to_js(routes):
-    seen_places = set()  # Množina pro uchování již přidaných názvů
+    places = {}  # Místo -> položka seznamu, v pořadí prvního výskytu
     data_for_js = []
 
-    for route in routes:
+    for route_id, route in enumerate(routes):
         place = route["title"]
-        if place not in seen_places:  # Kontrola, zda je jméno již přidáno
-            data_for_js.append({"place": place, "date": route["date"]})
-            seen_places.add(place)  # Přidání názvu do množiny
+        if place not in places:  # Kontrola, zda je jméno již přidáno
+            places[place] = {"place": place, "date": route["date"], "routes": []}
+            data_for_js.append(places[place])
+        places[place]["routes"].append(route_id)
 
     return data_for_js
 
-# Vytvoření mapy
-map_obj = folium.Map(location=[50.209, 15.832], zoom_start=13, control_scale=True)
+# Text pro vyhledávání bez diakritiky a velkých písmen ('Šumava' -> 'sumava')
+def fold_text(text):
+    decomposed = unicodedata.normalize('NFD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
 
-# Načtení a přidání GPX souborů na mapu
-gpx_files = load_gpx_files('gpx')
-routes = add_gpx_to_map(gpx_files, map_obj)
-data_for_js = save_routes_to_js(routes)
-data_routes = group_routes(routes)
+# Vyhledávací index nad místy ze save_routes_to_js: klíče položky (název bez diakritiky
+# a data jejích tras), trigramy klíčů -> čísla položek a datum -> čísla tras.
+# Klíče začínají mezerou a ke každému slovu patří i dvojice ' x', takže jedno- a dvouznakový
+# dotaz hledá začátky slov, delší dotaz podřetězec (kandidáti se v prohlížeči ověří)
+def build_search_index(data_for_js, routes):
+    keys = []
+    grams = defaultdict(list)
+    dates = defaultdict(list)
+    for entry_id, entry in enumerate(data_for_js):
+        entry_dates = [routes[route_id]["date"] for route_id in entry["routes"]]
+        for route_id, route_date in zip(entry["routes"], entry_dates):
+            dates[route_date].append(route_id)
+        entry_keys = [fold_text(entry["place"])] + list(dict.fromkeys(entry_dates))
+        keys.append(entry_keys)
+
+        entry_grams = set()
+        for key in entry_keys:
+            padded = ' ' + key
+            entry_grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+            entry_grams.update(' ' + word[0] for word in key.split())
+        for gram in sorted(entry_grams):
+            grams[gram].append(entry_id)
+
+    return {'keys': keys, 'grams': grams, 'dates': dates, 'limit': SEARCH_LIMIT}
 
 # HTML a CSS pro vyhledávací pole, panel s roky a mapu
-content = f"""<!DOCTYPE html>
+# route_data_url: adresa dat tras v režimu --split nebo --lod (routes pak obsahují jen index bez bodů,
+# s --lod bez --split nejhrubší úroveň detailu)
+# data_script: adresa samostatného skriptu s daty stránky, jinak se data vloží přímo do stránky
+# canvas: trasy se kreslí na plátno, po jedné vícenásobné čáře na rok
+# heatmap: obrázek heatmapy z write_heatmap, při nízkém zoomu se zobrazí místo tras
+# tiles: dlaždice tras z write_tiles, do jejich nejvyššího zoomu se zobrazí místo vektorů
+# shared_paths: sdílené úseky ze share_geometry, na které odkazují části tras
+# Stránka se vrací po částech: šablona se vykreslí se značkami místo dat a data tras se mezi její
+# části serializují postupně, takže paměť nezávisí na velikosti archivu
+def iter_html(routes, data_for_js, data_routes, spatial_index, search_index, precision=POLYLINE_PRECISION,
+              route_data_url=None, data_script=None, canvas=False, heatmap=None, tiles=None, shared_paths=None):
+    if data_script is None:
+        data_tag = ''
+        data_chunks = {
+            'data': [json.dumps(data_for_js, ensure_ascii=False, indent=4)],
+            'groups': iter_json(data_routes),
+            'routes': iter_json(routes),
+            'spatialIndex': iter_json(spatial_index, 2),
+            'searchIndex': iter_json(search_index, 2, ensure_ascii=False),
+            'sharedPaths': iter_json(shared_paths),
+        }
+        js_data, js_groups, js_routes, js_spatial_index, js_search_index, js_shared_paths = (
+            f'\0{name}\0' for name in data_chunks
+        )
+    else:
+        data_tag = f'<script src="{data_script}"></script>'
+        data_chunks = {}
+        js_data, js_groups, js_routes, js_spatial_index, js_search_index, js_shared_paths = (
+            'mapData.data', 'mapData.groups', 'mapData.routes', 'mapData.spatialIndex', 'mapData.searchIndex',
+            'mapData.sharedPaths'
+        )
+    year_checkboxes = '\n'.join(
+        f'    <label><input type="checkbox" name="year" value="{year}" onchange="filterRoutes()" checked>'
+        f'<span class="year-color" style="background-color: {color};"></span>{year}</label>'
+        for year, color in route_years(routes)
+    )
+    if heatmap is not None:
+        year_checkboxes += ('\n    <label><input type="checkbox" id="heatmapToggle" onchange="filterRoutes()" checked>'
+                            'Heatmapa</label>')
+    template = f"""<!DOCTYPE html>
 <html lang="cs-CZ">
 <head>
     <meta http-equiv="content-type" content="text/html; charset=UTF-8" />
@@ -173,7 +1439,7 @@ content = f"""<!DOCTYPE html>
             <meta name="viewport" content="width=device-width,
                 initial-scale=1.0, maximum-scale=1.0, user-scalable=no" />
 <title>TOM Hraboši - výpravy</title>
-        
+        {data_tag}
 </head>
 <style>
     body, html {{             
@@ -271,6 +1537,13 @@ content = f"""<!DOCTYPE html>
     .category-panel input[type="checkbox"] {{
         margin-right: 10px;
     }}
+    .year-color {{
+        display: inline-block;
+        width: 12px;
+        height: 12px;
+        margin-right: 6px;
+        border-radius: 2px;
+    }}
     .suggestions {{
         position: absolute;
         left: 25px;
@@ -465,7 +1738,7 @@ content = f"""<!DOCTYPE html>
 </div>
 <div id="map"></div>
 <div class="search-container">
-    <input type="text" id="searchBar" class="search-input" placeholder="Vyhledat výpravu..." onkeyup="showSuggestions()">
+    <input type="text" id="searchBar" class="search-input" placeholder="Vyhledat výpravu..." oninput="showSuggestions()">
     <div class="search-icon" onclick="findLocation()" title="Vyhledat">
         <img src="obrazky/lupa.png" alt="Lupa">
     </div>
@@ -473,8 +1746,7 @@ content = f"""<!DOCTYPE html>
 </div>
 <button class="category-button" onclick="toggleCategoryPanel()">Roky</button>
 <div class="category-panel" id="categoryPanel">
-    <label><input type="checkbox" value="2024" onchange="filterRoutes()" checked>2024</label>
-    <label><input type="checkbox" value="2023" onchange="filterRoutes()" checked>2023</label>
+{year_checkboxes}
 </div>
 <div class="route-button" onclick="toggleRoutePanel()">    
     <div class="hamburger hamburger1">
@@ -487,44 +1759,88 @@ content = f"""<!DOCTYPE html>
     <div id="routeList"></div>
 </div>
 <script>
-const data = {json.dumps(data_for_js, ensure_ascii=False, indent=4)};
+const data = {js_data};
+const searchIndex = {js_search_index};
 
 document.getElementById('searchBar').addEventListener('keydown', function(event) {{
     if (event.key === 'Enter') {{
         event.preventDefault();
+        clearTimeout(suggestionTimer);
+        document.getElementById("suggestions").replaceChildren();
         findLocation();}}}});
-function showSuggestions() {{
-    const input = document.getElementById("searchBar").value.trim();
-    const suggestions = document.getElementById("suggestions");
-    suggestions.innerHTML = "";
 
-    if (input.length === 0) return; 
+// Text bez diakritiky a velkých písmen, stejně jako fold_text při sestavení
+function foldText(text) {{
+    return text.normalize('NFD').replace(/[\\u0300-\\u036f]/g, '').toLowerCase();
+}}
 
-    
-    const datePattern1 = /^\d{{2}}\.\d{{2}}\.\d{{4}}$/; 
-    const datePattern2 = /^\d{{8}}$/;               
-    let searchDate = input;
+// Dotaz ve tvaru YYYYMMDD se hledá jako datum DD.MM.YYYY
+function normalizeQuery(input) {{
+    const query = foldText(input.trim());
+    if (/^\\d{{8}}$/.test(query)) {{
+        return `${{query.slice(6, 8)}}.${{query.slice(4, 6)}}.${{query.slice(0, 4)}}`;
+    }}
+    return query;
+}}
 
-    if (datePattern2.test(input)) {{
-      searchDate = `${{input.slice(6, 8)}}.${{input.slice(4, 6)}}.${{input.slice(0, 4)}}`;
+// Položky odpovídající dotazu seřazené podle shody (celý název, začátek názvu, začátek slova,
+// část názvu, datum), nejvýše searchIndex.limit položek. Kandidáti jsou průnikem seznamů
+// trigramů dotazu, kratší dotaz hledá jen začátky slov
+function searchEntries(query) {{
+    if (query.length === 0) return [];
+    const grams = [];
+    if (query.length < 3) {{
+        grams.push(' ' + query);
+    }} else {{
+        for (let i = 0; i + 3 <= query.length; i++) grams.push(query.slice(i, i + 3));
+    }}
+    const lists = grams.map(gram => searchIndex.grams[gram] || []).sort((a, b) => a.length - b.length);
+    let candidates = lists[0];
+    for (let i = 1; i < lists.length && candidates.length > 0; i++) {{
+        const list = new Set(lists[i]);
+        candidates = candidates.filter(id => list.has(id));
     }}
 
-    const filteredData = data.filter(item => {{
-      return (
-        item.place.toLowerCase().includes(input.toLowerCase()) ||  
-        item.date.includes(searchDate)                             
-      );
+    const matches = key => query.length < 3 ? (' ' + key).includes(' ' + query) : key.includes(query);
+    const results = [];
+    candidates.forEach(id => {{
+        const keys = searchIndex.keys[id];
+        const name = keys[0];
+        let rank;
+        if (name === query) rank = 0;
+        else if (name.startsWith(query)) rank = 1;
+        else if (name.includes(' ' + query)) rank = 2;
+        else if (matches(name)) rank = 3;
+        else if (keys.slice(1).some(matches)) rank = 4;
+        else return;
+        results.push({{ id: id, rank: rank }});
     }});
+    results.sort((a, b) => a.rank - b.rank || a.id - b.id);
+    return results.slice(0, searchIndex.limit);
+}}
 
+// Návrhy se hledají až po krátké pauze v psaní
+let suggestionTimer = null;
+function showSuggestions() {{
+    clearTimeout(suggestionTimer);
+    suggestionTimer = setTimeout(renderSuggestions, 120);
+}}
+
+function renderSuggestions() {{
+    const searchBar = document.getElementById("searchBar");
+    const suggestions = document.getElementById("suggestions");
+    const fragment = document.createDocumentFragment();
 
-    filteredData.forEach(item => {{
+    searchEntries(normalizeQuery(searchBar.value)).forEach(result => {{
+      const item = data[result.id];
       const suggestionDiv = document.createElement("div");
       suggestionDiv.textContent = item.place;
-      suggestionDiv.onclick = () => {{ document.getElementById("searchBar").value = item.place; suggestions.innerHTML = ""; findLocation();}};
-      suggestions.appendChild(suggestionDiv);
+      suggestionDiv.onclick = () => {{ searchBar.value = item.place; suggestions.replaceChildren(); findLocation(item.routes);}};
+      fragment.appendChild(suggestionDiv);
     }});
+    suggestions.replaceChildren(fragment);
   }}
-const routes = {json.dumps(data_routes)};
+const routes = {js_groups};
 
 document.addEventListener('DOMContentLoaded', function() {{
     const panel = document.getElementById('routePanel');
@@ -563,6 +1879,9 @@ document.addEventListener('DOMContentLoaded', function() {{
     routes.forEach(route => {{
         const routeItem = document.createElement('div');
         routeItem.innerHTML = `<b>${{route.place}}</b> <br>${{route.date}}`;
+        if (route.distance) {{
+            routeItem.innerHTML += ` · ${{(route.distance / 1000).toFixed(1)}} km`;
+        }}
         
 
         routeItem.onclick = () => {{
@@ -578,23 +1897,330 @@ document.addEventListener('DOMContentLoaded', function() {{
     }});
 }});
 
+function formatDuration(seconds) {{
+    const minutes = Math.round(seconds / 60);
+    return Math.floor(minutes / 60) + ':' + String(minutes % 60).padStart(2, '0') + ' h';
+}}
+
+// Obsah popupu trasy včetně statistik (délka, převýšení, čas a rychlost v pohybu)
+function routePopup(route) {{
+    let content = "<div class='popup-content'><b>" + route.title + "</b><br>" + route.date;
+    const stats = route.stats;
+    if (stats && stats.distance) {{
+        content += "<br>" + (stats.distance / 1000).toFixed(1) + " km";
+        if (stats.ascent || stats.descent) {{
+            content += ", ↑ " + stats.ascent + " m, ↓ " + stats.descent + " m";
+        }}
+        if (stats.moving_time) {{
+            content += "<br>v pohybu " + formatDuration(stats.moving_time) + ", " + stats.speed + " km/h";
+        }}
+    }}
+    return content + "</div>";
+}}
+
 function focusOnRoute(place) {{
     const searchBar = document.getElementById('searchBar');
     searchBar.value = place;
     findLocation();
 }}
     document.addEventListener('DOMContentLoaded', function() {{
-        const map = L.map('map').setView([50.209, 15.832], 13);
+        const canvasMode = {json.dumps(canvas)};
+        const map = L.map('map', {{preferCanvas: canvasMode}}).setView([50.209, 15.832], 13);
         L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
             maxZoom: 18,
             attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors | <a href="https://hrabosi.tomici.cz/">TOM Hraboši</a> 🐭',
         }}).addTo(map);
-        const routes = {json.dumps(routes)};
+        function decodePolyline(encoded, precision) {{
+            const factor = Math.pow(10, precision);
+            const points = [];
+            let index = 0, lat = 0, lon = 0;
+            while (index < encoded.length) {{
+                const deltas = [0, 0];
+                for (let axis = 0; axis < 2; axis++) {{
+                    let result = 0, shift = 0, byte;
+                    do {{
+                        byte = encoded.charCodeAt(index++) - 63;
+                        result |= (byte & 0x1f) << shift;
+                        shift += 5;
+                    }} while (byte >= 0x20);
+                    deltas[axis] = (result & 1) ? ~(result >> 1) : (result >> 1);
+                }}
+                lat += deltas[0];
+                lon += deltas[1];
+                points.push([lat / factor, lon / factor]);
+            }}
+            return points;
+        }}
+
+        // Sdílené úseky (režim --shared): trasa se skládá z částí, část jsou buď vlastní body,
+        // nebo číslo sdíleného úseku (~číslo pro úsek projitý opačným směrem)
+        const sharedPaths = ({js_shared_paths} || []).map(path =>
+            typeof path === 'string' ? decodePolyline(path, {precision}) : path);
+        function joinParts(parts) {{
+            return [].concat(...parts.map(function(part) {{
+                if (typeof part !== 'number') return typeof part === 'string' ? decodePolyline(part, {precision}) : part;
+                return part < 0 ? sharedPaths[~part].slice().reverse() : sharedPaths[part];
+            }}));
+        }}
+        function decodeRoute(route) {{
+            if (route.parts) {{
+                route.points = joinParts(route.parts);
+                delete route.parts;
+            }}
+            if (typeof route.points === 'string') route.points = decodePolyline(route.points, {precision});
+            (route.tiers || []).forEach(tier => {{
+                if (typeof tier[1] === 'string') tier[1] = decodePolyline(tier[1], {precision});
+            }});
+        }}
+        const routes = {js_routes};
+        routes.forEach(decodeRoute);
+
+        // Úroveň detailu trasy pro daný zoom: index hrubší úrovně v route.tiers, nebo počet
+        // úrovní pro plné body; body dosud nestažené úrovně jsou null
+        function routeLevel(route, zoom) {{
+            const tiers = route.tiers || [];
+            const level = tiers.findIndex(tier => zoom <= tier[0]);
+            return level < 0 ? tiers.length : level;
+        }}
+        function levelPoints(route, level) {{
+            return level < (route.tiers || []).length ? route.tiers[level][1] : route.points;
+        }}
+        function routePoints(route, zoom) {{
+            return levelPoints(route, routeLevel(route, zoom));
+        }}
+
+        // V režimu --split (a u úrovní detailu --lod) se geometrie tras stahuje až když je potřeba,
+        // vždy jen úroveň pro aktuální zoom
+        const routeDataUrl = {json.dumps(route_data_url)};
+        function loadRoute(route) {{
+            const level = routeLevel(route, map.getZoom());
+            if (levelPoints(route, level)) return Promise.resolve(route);
+            route.loading = route.loading || [];
+            if (!route.loading[level]) {{
+                const file = route.files ? route.files[level] : (route.file || route.id + '.json');
+                route.loading[level] = fetch(routeDataUrl + file)
+                    .then(response => response.json())
+                    .then(geometry => {{
+                        if (level < (route.tiers || []).length) route.tiers[level][1] = geometry.points;
+                        else Object.assign(route, geometry);
+                        decodeRoute(route);
+                        return route;
+                    }});
+            }}
+            return route.loading[level];
+        }}
+
+        // Jedna vrstva na rok, přepínání roků jen přidá nebo odebere celou vrstvu;
+        // v režimu --canvas obsahuje vrstva jedinou čáru se všemi zobrazenými trasami roku
+        const yearLayers = {{}};
+        const yearLines = {{}};
         routes.forEach(function(route) {{
-            L.polyline(route.points, {{color: route.color}}).addTo(map)
-                .bindPopup("<div class='popup-content'><b>" + route.title + "</b><br>" + route.date + "</div>");
+            if (yearLayers[route.year]) return;
+            yearLayers[route.year] = L.layerGroup();
+            if (canvasMode) {{
+                yearLines[route.year] = L.polyline([], {{color: route.color, interactive: false}})
+                    .addTo(yearLayers[route.year]);
+            }}
         }});
 
+        function addRoutePolyline(route) {{
+            route.shownPoints = routePoints(route, map.getZoom());
+            route.polyline = L.polyline(route.shownPoints, {{color: route.color}})
+                .bindPopup(routePopup(route));
+            yearLayers[route.year].addLayer(route.polyline);
+        }}
+
+        let selectedYears = null;
+        function isRouteSelected(route) {{
+            return selectedYears === null || selectedYears.includes(route.year);
+        }}
+
+        // Trasy procházející danou oblastí podle mřížkového indexu
+        const spatialIndex = {js_spatial_index};
+        function routesInBounds(bounds) {{
+            const size = spatialIndex.cellSize;
+            const south = Math.floor(bounds.getSouth() / size), north = Math.floor(bounds.getNorth() / size);
+            const west = Math.floor(bounds.getWest() / size), east = Math.floor(bounds.getEast() / size);
+            // Při velkém výřezu je rychlejší projít ohraničení tras než buňky mřížky
+            if ((north - south + 1) * (east - west + 1) > routes.length) {{
+                return routes.filter(route => route.bounds && bounds.intersects(L.latLngBounds(route.bounds)));
+            }}
+            const ids = new Set();
+            for (let i = south; i <= north; i++) {{
+                for (let j = west; j <= east; j++) {{
+                    (spatialIndex.cells[i + ',' + j] || []).forEach(id => ids.add(id));
+                }}
+            }}
+            return Array.from(ids, id => routes[id]);
+        }}
+        window.routesInArea = routesInBounds;
+
+        // Vykreslení vybraných tras ve výřezu mapy, trasy mimo výřez se z vrstvy roku odeberou
+        // a nenačtené se stáhnou až když do výřezu zasáhnou; vrstvy skrytých roků se nemění.
+        // Zobrazené trasy přejdou na úroveň detailu aktuálního zoomu, až je stažená
+        function showRoutePolylines() {{
+            const visible = new Set(routesInBounds(map.getBounds()));
+            routes.forEach(function(route) {{
+                if (!isRouteSelected(route)) return;
+                const layer = yearLayers[route.year];
+                if (!visible.has(route)) {{
+                    if (route.polyline) layer.removeLayer(route.polyline);
+                    return;
+                }}
+                if (route.polyline && !layer.hasLayer(route.polyline)) layer.addLayer(route.polyline);
+                if (route.polyline && route.shownPoints === routePoints(route, map.getZoom())) return;
+                loadRoute(route).then(function() {{
+                    const points = routePoints(route, map.getZoom());
+                    if (!points) return;
+                    if (!route.polyline) addRoutePolyline(route);
+                    else if (points !== route.shownPoints) {{
+                        route.shownPoints = points;
+                        route.polyline.setLatLngs(points);
+                    }}
+                }});
+            }});
+        }}
+
+        // Režim --canvas: trasy ve výřezu se po letech slijí do jedné čáry, body odpovídají zoomu;
+        // výsledek staršího volání, které ještě čekalo na stažení tras, se zahodí
+        let shownRoutes = [];
+        let drawRequest = 0;
+        function showMergedRoutes() {{
+            const request = ++drawRequest;
+            const visible = routesInBounds(map.getBounds()).filter(isRouteSelected);
+            Promise.all(visible.map(loadRoute)).then(function() {{
+                if (request !== drawRequest) return;
+                const zoom = map.getZoom();
+                const lines = {{}};
+                Object.keys(yearLines).forEach(year => {{ lines[year] = []; }});
+                visible.forEach(function(route) {{
+                    route.shownPoints = routePoints(route, zoom);
+                    if (route.shownPoints) lines[route.year].push(route.shownPoints);
+                }});
+                Object.keys(yearLines).forEach(year => yearLines[year].setLatLngs(lines[year]));
+                shownRoutes = visible;
+            }});
+        }}
+
+        // Popup podle kliknutí: nejbližší z tras candidates v dosahu HIT_TOLERANCE pixelů,
+        // trasy mimo své ohraničení se přeskočí bez procházení bodů
+        const hitTolerance = {HIT_TOLERANCE};
+        function routeAtPoint(latlng, candidates) {{
+            const point = map.latLngToLayerPoint(latlng);
+            const tolerance = hitTolerance;
+            const zoom = map.getZoom();
+            let nearest = null, nearestDistance = tolerance;
+            candidates.forEach(function(route) {{
+                if (!isRouteSelected(route)) return;
+                const southWest = map.latLngToLayerPoint(route.bounds[0]);
+                const northEast = map.latLngToLayerPoint(route.bounds[1]);
+                if (point.x < southWest.x - tolerance || point.x > northEast.x + tolerance ||
+                    point.y > southWest.y + tolerance || point.y < northEast.y - tolerance) return;
+                const points = routePoints(route, zoom);
+                if (!points || !points.length) return;
+                let previous = map.latLngToLayerPoint(points[0]);
+                for (let i = 1; i < points.length; i++) {{
+                    const current = map.latLngToLayerPoint(points[i]);
+                    const distance = L.LineUtil.pointToSegmentDistance(point, previous, current);
+                    if (distance <= nearestDistance) {{
+                        nearest = route;
+                        nearestDistance = distance;
+                    }}
+                    previous = current;
+                }}
+            }});
+            return nearest;
+        }}
+
+        const showRoutes = canvasMode ? showMergedRoutes : showRoutePolylines;
+
+        // Heatmapa (režim --heatmap) se do zoomu heatmap.maxZoom zobrazí místo tras,
+        // trasy se pak nekreslí ani nestahují
+        const heatmap = {json.dumps(heatmap)};
+        const heatmapLayer = heatmap && L.imageOverlay(heatmap.url, heatmap.bounds, {{opacity: 0.85, interactive: false}});
+        function heatmapActive() {{
+            return Boolean(heatmapLayer) && document.getElementById('heatmapToggle').checked
+                && map.getZoom() <= heatmap.maxZoom;
+        }}
+
+        // Dlaždice tras (režim --tiles) po rocích, do zoomu tiles.maxZoom místo vektorů;
+        // geometrie trasy se stáhne až po kliknutí na ni
+        const tiles = {json.dumps(tiles)};
+        const yearTiles = {{}};
+        if (tiles) {{
+            Object.keys(tiles.bounds).forEach(function(year) {{
+                yearTiles[year] = L.tileLayer(tiles.url.replace('{{year}}', year), {{
+                    minNativeZoom: tiles.minZoom,
+                    maxNativeZoom: tiles.maxZoom,
+                    bounds: tiles.bounds[year],
+                    zIndex: 2,
+                    errorTileUrl: 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7',
+                }});
+            }});
+        }}
+        function tilesActive() {{
+            return Boolean(tiles) && !heatmapActive() && map.getZoom() <= tiles.maxZoom;
+        }}
+        function vectorsActive() {{
+            return !heatmapActive() && !tilesActive();
+        }}
+
+        function refreshRoutes() {{
+            if (vectorsActive()) showRoutes();
+        }}
+        function updateLayers() {{
+            const showHeatmap = heatmapActive(), showTiles = tilesActive(), showVectors = vectorsActive();
+            if (heatmapLayer) {{
+                if (showHeatmap) map.addLayer(heatmapLayer);
+                else map.removeLayer(heatmapLayer);
+            }}
+            Object.keys(yearLayers).forEach(function(year) {{
+                const selected = isRouteSelected({{year: Number(year)}});
+                if (showVectors && selected) map.addLayer(yearLayers[year]);
+                else map.removeLayer(yearLayers[year]);
+                if (!yearTiles[year]) return;
+                if (showTiles && selected) map.addLayer(yearTiles[year]);
+                else map.removeLayer(yearTiles[year]);
+            }});
+        }}
+
+        // Zvýraznění trasy nalezené kliknutím do dlaždic, odebere se se zavřením popupu
+        let highlight = null;
+        function highlightRoute(route, latlng) {{
+            if (highlight) map.removeLayer(highlight);
+            highlight = L.polyline(routePoints(route, map.getZoom()), {{color: route.color, weight: 5, interactive: false}})
+                .addTo(map);
+            L.popup().setLatLng(latlng).setContent(routePopup(route)).openOn(map);
+        }}
+        map.on('popupclose', function() {{
+            if (highlight) map.removeLayer(highlight);
+            highlight = null;
+        }});
+
+        map.on('click', function(event) {{
+            if (canvasMode && vectorsActive()) {{
+                const route = routeAtPoint(event.latlng, shownRoutes);
+                if (route) L.popup().setLatLng(event.latlng).setContent(routePopup(route)).openOn(map);
+            }} else if (tilesActive()) {{
+                // Kandidáti z mřížkového indexu v okolí kliknutí, stáhnou se jen jejich geometrie
+                const point = map.latLngToContainerPoint(event.latlng);
+                const area = L.latLngBounds(
+                    map.containerPointToLatLng(point.subtract([hitTolerance, hitTolerance])),
+                    map.containerPointToLatLng(point.add([hitTolerance, hitTolerance]))
+                );
+                const candidates = routesInBounds(area).filter(route =>
+                    isRouteSelected(route) && route.bounds && area.intersects(L.latLngBounds(route.bounds)));
+                Promise.all(candidates.map(loadRoute)).then(function() {{
+                    const route = routeAtPoint(event.latlng, candidates);
+                    if (route) highlightRoute(route, event.latlng);
+                }});
+            }}
+        }});
+        refreshRoutes();
+        updateLayers();
+        map.on('moveend', refreshRoutes);
+        map.on('zoomend', updateLayers);
+
         L.marker([50.206875, 15.8349467], {{
             icon: L.icon({{
             iconUrl: 'obrazky/hrabos.png',
@@ -603,19 +2229,30 @@ function focusOnRoute(place) {{
         }}).addTo(map)
         .bindPopup("<div class='popup-content'><b>Hraboší doupě</b></div>");
 
-        window.findLocation = function() {{
-            const searchQuery = document.getElementById('searchBar').value.toLowerCase();
-            const matchingRoutes = routes.filter(route =>
-            route.title.toLowerCase() === searchQuery || route.date.includes(searchQuery)
-            );
+        // Trasy se hledají podle čísel: z vybraného návrhu, přesného data, nebo nejlepší shody dotazu
+        window.findLocation = function(routeIds) {{
+            if (!Array.isArray(routeIds)) {{
+                // Trasy míst s přesně zadaným názvem a všechny trasy, jejichž datum dotaz obsahuje;
+                // bez takové shody trasy nejlepšího návrhu
+                const query = normalizeQuery(document.getElementById('searchBar').value);
+                const results = searchEntries(query);
+                const ids = new Set(results.filter(result => result.rank === 0)
+                    .flatMap(result => data[result.id].routes));
+                Object.entries(searchIndex.dates).forEach(([date, dateRoutes]) => {{
+                    if (date.includes(query)) dateRoutes.forEach(id => ids.add(id));
+                }});
+                routeIds = ids.size > 0 ? Array.from(ids) : (results.length > 0 ? data[results[0].id].routes : []);
+            }}
+            const matchingRoutes = routeIds.map(id => routes[id]);
             if (matchingRoutes.length > 0) {{
-                const latLngs = matchingRoutes.flatMap(route => route.points);
+                const trips = new Set(matchingRoutes.map(route => route.trip));
+                const latLngs = Array.from(trips).flatMap(trip => spatialIndex.trips[trip] || []);
                 const bounds = L.latLngBounds(latLngs);
                 map.fitBounds(bounds);
                 if (matchingRoutes.length === 1) {{
                     const popup = L.popup()
                         .setLatLng(matchingRoutes[0].center)
-                        .setContent("<div class='popup-content'><b>" + matchingRoutes[0].title + "</b><br>" + matchingRoutes[0].date + "</div>")
+                        .setContent(routePopup(matchingRoutes[0]))
                         .openOn(map);
                 }}
             }} else {{
@@ -628,42 +2265,364 @@ function focusOnRoute(place) {{
             panel.style.display = panel.style.display === 'block' ? 'none' : 'block';
         }};
 
+        // Vrstvy vybraných roků se nejdřív doplní o trasy ve výřezu a pak se zobrazí
         window.filterRoutes = function() {{
-            const checkboxes = document.querySelectorAll('.category-panel input[type="checkbox"]:checked');
-            const selectedYears = Array.from(checkboxes).map(checkbox => parseInt(checkbox.value));
-    }}
+            const checkboxes = document.querySelectorAll('.category-panel input[name="year"]:checked');
+            selectedYears = Array.from(checkboxes).map(checkbox => parseInt(checkbox.value));
+            refreshRoutes();
+            updateLayers();
+        }};
+    }});
+</script>
+"""
+    # Liché části šablony jsou názvy dat
+    for index, part in enumerate(template.split('\0')):
+        if index % 2:
+            yield from data_chunks[part]
+        else:
+            yield part
 
 
-window.filterRoutes = function() {{
-    const checkboxes = document.querySelectorAll('.category-panel input[type="checkbox"]:checked');
-    const selectedYears = Array.from(checkboxes).map(checkbox => parseInt(checkbox.value));
+# Měření kroků sestavení: čas a počty zpracovaných dat, s trace_memory i špička alokované paměti
+# (tracemalloc sestavení mnohonásobně zpomalí, proto jen na vyžádání); vypnuté měření jen předá
+# řízení dál
+class BuildReport:
 
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = []
+        self.counts = {}
 
-    map.eachLayer(function(layer) {{
-        if (layer instanceof L.Polyline || layer instanceof L.Marker) {{
-            map.removeLayer(layer);
-        }}
-    }});
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
 
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'stage': name,
+                'time': round(time.perf_counter() - start, 6),
+                'peak_memory': tracemalloc.get_traced_memory()[1] if self.trace_memory else None,
+            })
 
-    const matchingRoutes = routes.filter(route => selectedYears.includes(route.year));
-    matchingRoutes.forEach(function(route) {{
-        L.polyline(route.points, {{color: route.color}}).addTo(map)
-            .bindPopup("<div class='popup-content'><b>" + route.title + "</b><br>" + route.date + "</div>");
-    }});
+    def count(self, **counts):
+        if self.enabled:
+            self.counts.update(counts)
+
+    def write(self, path, profile=None):
+        peak_memory = max((stage['peak_memory'] for stage in self.stages), default=0) if self.trace_memory else None
+        report = {
+            'total_time': round(sum(stage['time'] for stage in self.stages), 6),
+            'peak_memory': peak_memory,
+            'stages': self.stages,
+            'counts': self.counts,
+        }
+        if self.trace_memory:
+            tracemalloc.stop()
+        # Nejnáročnější funkce podle celkového času včetně volaných funkcí
+        if profile is not None:
+            stats = pstats.Stats(profile)
+            top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:25]
+            report['profile'] = [
+                {'function': f'{filename}:{line}({name})', 'calls': calls, 'total_time': round(total, 6),
+                 'cumulative_time': round(cumulative, 6)}
+                for (filename, line, name), (_, calls, total, cumulative, _) in top
+            ]
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=4)
+
+        for stage in self.stages:
+            memory = f"{stage['peak_memory'] / 2**20:>9.1f} MB" if self.trace_memory else ''
+            print(f"{stage['stage']:>20} {stage['time']:>9.3f} s {memory}".rstrip())
+
+NO_REPORT = BuildReport()
+
+# Vykreslení vlastní stránkou se šablonou (výchozí backend)
+def write_template_page(routes, args, output_file, report=NO_REPORT):
+    with report.stage('save_routes_to_js'):
+        data_for_js = save_routes_to_js(routes)
+    with report.stage('vyhledávací index'):
+        search_index = build_search_index(data_for_js, routes)
+    with report.stage('group_routes'):
+        data_routes = group_routes(routes)
+    with report.stage('prostorový index'):
+        spatial_index = build_spatial_index(routes)
+    heatmap = None
+    if args.heatmap:
+        with report.stage('heatmapa'):
+            heatmap = write_heatmap(routes, HEATMAP_FILE)
+    tiles = None
+    if args.tiles:
+        with report.stage('dlaždice'):
+            tiles = write_tiles(routes, TILE_DIR, workers=args.workers)
+    # Sdílení geometrie až po heatmapě a dlaždicích, které potřebují body tras
+    shared_paths = None
+    if args.shared:
+        with report.stage('sdílené úseky'):
+            routes, shared_paths = share_geometry(routes)
+        report.count(shared_paths=len(shared_paths))
+
+    route_data_url = None
+    with report.stage('serializace tras'):
+        # Úrovně detailu (--lod) se stahují podle zoomu, ve stránce zůstane jen nejhrubší
+        if args.split or args.lod:
+            routes = write_route_files(routes, ROUTE_DATA_DIR, args.encoding, args.precision, hashed_names=args.dist,
+                                       keep_coarse=not args.split)
+            route_data_url = ROUTE_DATA_DIR + '/'
+        else:
+            routes = serialize_routes(routes, args.encoding, args.precision)
+        if shared_paths is not None:
+            shared_paths = serialize_paths(shared_paths, args.encoding, args.precision)
+
+        data_script = None
+        if args.dist:
+            data_script = write_data_script(DATA_DIR, data_for_js, data_routes, routes, spatial_index, search_index,
+                                            shared_paths)
+
+    # Vykreslení a zápis HTML souboru po částech (přepíše se jen pokud se změnil)
+    with report.stage('HTML'):
+        content = iter_html(routes, data_for_js, data_routes, spatial_index, search_index, args.precision,
+                            route_data_url, data_script and data_script.replace(os.sep, '/'), args.canvas, heatmap, tiles,
+                            shared_paths)
+        changed = write_chunks_if_changed(output_file, content)
+    report.count(output_bytes=os.path.getsize(output_file))
+
+    if args.dist:
+        with report.stage('komprese'):
+            files = [output_file, data_script]
+            if route_data_url:
+                files += sorted(os.path.join(ROUTE_DATA_DIR, filename) for filename in route_files(routes))
+            write_dist(list(dict.fromkeys(files)), MANIFEST_FILE)
+    return changed
+
+# Vykreslení knihovnou folium (bez vyhledávání a panelů), folium se načítá jen pro tento backend
+def write_folium_page(routes, args, output_file, report=NO_REPORT):
+    with report.stage('folium'):
+        import folium
+
+        map_obj = folium.Map(location=[50.209, 15.832], zoom_start=13, control_scale=True)
+        # Trasy bez bodů (prázdný <trkseg>) folium nevykreslí
+        for route in (route for route in routes if len(route['points'])):
+            folium.PolyLine(
+                route['points'],
+                color=route['color'],
+                popup=f"<b>{route['title']}</b><br>{route['date']}",
+            ).add_to(map_obj)
+        # Prvky folium mají náhodná id; jejich očíslováním podle pořadí ve stránce je výstup
+        # opakovatelný a zapíše se jen při změně
+        ids = {}
+        html = FOLIUM_ID_PATTERN.sub(
+            lambda match: ids.setdefault(match.group(), f'_{len(ids):032x}'), map_obj.get_root().render()
+        )
+        return write_if_changed(output_file, html)
+
+RENDERERS = {
+    'template': write_template_page,
+    'folium': write_folium_page,
+}
+
+
+# Segmenty změněných souborů; nečitelné soubory (např. právě kopírované) se vynechají
+def load_changed_segments(changed, cache, workers, index):
+    try:
+        return load_segments(changed, cache, workers, index)
+    except (ET.ParseError, gpxpy.gpx.GPXException, OSError, ValueError):
+        pass
+    segments = {}
+    for entry in changed:
+        try:
+            segments.update(load_segments([entry], cache, index=index))
+        except (ET.ParseError, gpxpy.gpx.GPXException, OSError, ValueError) as error:
+            print(f'Soubor {entry[0]} nelze načíst: {error}')
+    return segments
+
+# Sledování adresáře gpx/ a průběžné přegenerování mapy; znovu se načtou jen přidané a změněné
+# soubory, trasy ostatních zůstávají v paměti a výstup se přepíše jen pokud se změnil
+def watch(args, interval):
+    lod_tiers = LOD_TIERS if args.lod else None
+    file_routes = {}
+    index = None
+    cache = open_cache(CACHE_FILE)
+    print('Sledování adresáře gpx/, ukončení Ctrl+C')
+    try:
+        while True:
+            gpx_files, current = scan_gpx_files('gpx', index)
+            print_malformed(current, index['malformed'] if index else ())
+            changed_paths, removed = changed_files(current, index)
+            changed_paths = set(changed_paths)
+            changed = [entry for entry in gpx_files if entry[0] in changed_paths]
+            if changed or removed:
+                with cache:
+                    segments = load_changed_segments(changed, cache, args.workers, current)
+                    evict_cache(cache, gpx_files)
+                parsed = [entry for entry in changed if entry[0] in segments]
+                file_routes.update(build_file_routes(parsed, segments, args.tolerance, lod_tiers))
+                for path in removed:
+                    file_routes.pop(path, None)
+
+                loaded = [entry for entry in gpx_files if entry[0] in file_routes]
+                routes = merge_file_routes(loaded, file_routes)
+                write_statistics(routes, loaded, STATS_FILE)
+                updated = RENDERERS[args.renderer](routes, args, OUTPUT_FILE)
+                write_file_index(INDEX_FILE, current)
+                print(f"{datetime.now():%H:%M:%S} změněno {len(changed)}, odebráno {len(removed)} souborů"
+                      f"{'' if updated is False else ', mapa aktualizována'}")
+            index = current
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cache.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Vytvoření mapy výprav z GPX souborů.')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='počet procesů pro parsování GPX souborů (1 = sériově, výchozí počet jader)')
+    parser.add_argument('-t', '--tolerance', type=float, default=SIMPLIFY_TOLERANCE,
+                        help=f'tolerance zjednodušení tras v metrech (0 = všechny body, výchozí {SIMPLIFY_TOLERANCE})')
+    parser.add_argument('--encoding', choices=['json', 'polyline'], default='json',
+                        help='formát bodů tras ve stránce (polyline = kompaktní encoded polyline)')
+    parser.add_argument('--precision', type=int, choices=[5, 6], default=POLYLINE_PRECISION,
+                        help='počet desetinných míst souřadnic v režimu polyline')
+    parser.add_argument('--lod', action='store_true',
+                        help=f'přidat hrubší úrovně detailu tras přepínané podle zoomu; stránka obsahuje jen '
+                             f'nejhrubší, jemnější stahuje z {ROUTE_DATA_DIR}/ (stránka pak musí běžet přes '
+                             'HTTP server)')
+    parser.add_argument('--archive', action='store_true',
+                        help=f'segmenty a sestavené trasy uložit po souborech do sloupcového archivu {ARCHIVE_DIR}/; '
+                             'při dalším sestavení se z něj vezmou nezměněné soubory')
+    parser.add_argument('--canvas', action='store_true',
+                        help='kreslit trasy na plátno (canvas), trasy jednoho roku jako jedna čára '
+                             '(rychlejší pro velké archivy)')
+    parser.add_argument('--heatmap', action='store_true',
+                        help=f'přidat heatmapu všech tras ({HEATMAP_FILE}), která se při nízkém zoomu '
+                             'zobrazí místo tras')
+    parser.add_argument('--tiles', action='store_true',
+                        help=f'předem vykreslit trasy do dlaždic {TILE_DIR}/ (zoom {min(TILE_ZOOMS)}–{max(TILE_ZOOMS)}), '
+                             'stránka je zobrazí místo tras a geometrii stáhne až po kliknutí')
+    parser.add_argument('--shared', action='store_true',
+                        help='opakované úseky tras (duplicitní soubory, společné cesty) uložit do stránky jen '
+                             f'jednou; části tras do {SHARED_TOLERANCE} m od dřívější trasy se nahradí jejími body')
+    parser.add_argument('--split', action='store_true',
+                        help=f'geometrii tras zapsat do samostatných souborů v {ROUTE_DATA_DIR}/ a stahovat ji '
+                             'až při zobrazení (stránka pak musí běžet přes HTTP server)')
+    parser.add_argument('--renderer', choices=sorted(RENDERERS), default='template',
+                        help='způsob vykreslení stránky (template = vlastní stránka s vyhledáváním)')
+    parser.add_argument('--dist', action='store_true',
+                        help='data stránky zapsat do souborů pojmenovaných podle hashe obsahu, přidat '
+                             'předkomprimované varianty (gzip, brotli) a manifest')
+    parser.add_argument('--watch', action='store_true',
+                        help='sledovat adresář gpx/ a mapu přegenerovat při každé změně')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='interval kontroly změn v režimu --watch v sekundách')
+    parser.add_argument('--report', action='store_true',
+                        help=f'změřit čas a počty dat jednotlivých kroků a zapsat je do {REPORT_FILE}')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='k měření kroků přidat špičku alokované paměti (tracemalloc); sestavení se '
+                             'výrazně zpomalí, časy kroků pak neodpovídají běžnému sestavení')
+    parser.add_argument('--cprofile', action='store_true',
+                        help=f'sestavení spustit pod cProfile (profil v {PROFILE_FILE}, nejnáročnější funkce v '
+                             f'{REPORT_FILE}); časy kroků zkresluje režie profileru')
+    parser.add_argument('--serve', action='store_true',
+                        help='po sestavení spustit lokální náhledový server (s --watch běží na pozadí)')
+    parser.add_argument('--port', type=int, default=8000, help='port náhledového serveru')
+    args = parser.parse_args(argv)
+    # Sledování drží trasy v paměti mezi průchody, archiv ani měření jednoho sestavení nepoužívá
+    if args.watch:
+        for flag in ('archive', 'report', 'trace_memory', 'cprofile'):
+            if getattr(args, flag):
+                parser.error(f"--{flag.replace('_', '-')} nelze použít s --watch")
+    return args
+
+
+def build(args):
+    report = BuildReport(args.report or args.cprofile or args.trace_memory, args.trace_memory)
+    profile = cProfile.Profile() if args.cprofile else None
+    report.start()
+    if profile is not None:
+        profile.enable()
+
+    # Načtení GPX souborů (i z podadresářů) a porovnání s indexem z posledního sestavení
+    with report.stage('load_gpx_files'):
+        previous = load_file_index(INDEX_FILE)
+        gpx_files, index = scan_gpx_files('gpx', previous)
+        changed, removed = changed_files(index, previous)
+    print_malformed(index)
+    print(f'Soubory: {len(gpx_files)}, od posledního sestavení změněno {len(changed)}, odebráno {len(removed)}, '
+          f"přeskočeno {len(index['malformed'])}")
+    lod_tiers = LOD_TIERS if args.lod else None
+    settings = archive_settings(args.tolerance, lod_tiers)
+
+    # S --archive se trasy nezměněných souborů vezmou z archivu; parsují a sestavují se jen nové
+    # a změněné soubory (při změně nastavení se trasy sestaví znovu z původních segmentů v archivu)
+    archive = None
+    file_routes = {}
+    if args.archive:
+        with report.stage('archiv'):
+            archive = load_archive(ARCHIVE_DIR)
+            if archive is not None:
+                file_routes = archived_routes(archive, index, settings)
+    outdated = [entry for entry in gpx_files if entry[0] not in file_routes]
+    if outdated or (archive is not None and len(archive['files']) != len(gpx_files)):
+        cache = open_cache(CACHE_FILE)
+        with cache:
+            with report.stage('parsování'):
+                segments = archived_segments(archive, index) if archive is not None else {}
+                segments.update(load_segments([entry for entry in gpx_files if entry[0] not in segments],
+                                              cache, args.workers, index))
+            with report.stage('build_routes'):
+                file_routes.update(build_file_routes(outdated, segments, args.tolerance, lod_tiers))
+            evict_cache(cache, gpx_files)
+        cache.close()
+        report.count(points=sum(len(segment['points']) for file_segments in segments.values()
+                                for segment in file_segments))
+        if args.archive:
+            with report.stage('zápis archivu'):
+                write_archive(ARCHIVE_DIR, gpx_files, index, segments, file_routes, settings)
+    routes = merge_file_routes(gpx_files, file_routes)
+    report.count(
+        files=len(gpx_files),
+        changed_files=len(changed),
+        malformed_files=len(index['malformed']),
+        segments=len(routes),
+        simplified_points=sum(len(route['points']) for route in routes),
+    )
+    with report.stage('statistiky'):
+        write_statistics(routes, gpx_files, STATS_FILE)
+
+    RENDERERS[args.renderer](routes, args, OUTPUT_FILE, report)
+    write_file_index(INDEX_FILE, index)
+
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(PROFILE_FILE)
+    if report.enabled:
+        report.write(REPORT_FILE, profile)
+
+
+def main():
+    args = parse_args()
+    if args.watch:
+        if args.serve:
+            start_server('.', args.port)
+        watch(args, args.interval)
+        return
+
+    build(args)
+    if args.serve:
+        serve('.', args.port)
 
-    L.marker([50.206875, 15.8349467], {{
-        icon: L.icon({{
-            iconUrl: 'obrazky/hrabos.png',
-            iconSize: [30, 30]
-        }})
-    }}).addTo(map)
-    .bindPopup("<div class='popup-content'><b>Hraboší doupě</b></div>");
-}};
-}});
-</script>
-"""
 
-# Uložení upraveného HTML souboru
-with open('mapa.html', 'w', encoding='utf-8') as file:
-    file.write(content)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
\ No newline at end of file
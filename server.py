@@ -0,0 +1,161 @@
+import os
+import re
+import time
+import argparse
+import threading
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Předkomprimované varianty v pořadí preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+
+# Kódování přijatelná podle hlavičky Accept-Encoding: kódování s q=0 (výslovně nebo přes *) se vynechá
+def accepted_encodings(header):
+    weights = {}
+    for token in header.split(','):
+        name, *params = [part.strip() for part in token.split(';')]
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name:
+            weights[name.lower()] = weight
+    return {encoding for encoding, _ in ENCODINGS if weights.get(encoding, weights.get('*', 0.0)) > 0}
+
+# Náhledový server sestavené mapy: předkomprimované soubory (.br/.gz), ETag a If-None-Match,
+# rozsahy (Range) a záznam přenesených bajtů a doby vyřízení každého požadavku
+class PreviewHandler(SimpleHTTPRequestHandler):
+
+    def handle_one_request(self):
+        self.started = time.perf_counter()
+        self.status = None
+        self.encoding = None
+        self.bytes_sent = 0
+        self.remaining = None
+        super().handle_one_request()
+        if self.status is not None:
+            elapsed = (time.perf_counter() - self.started) * 1000
+            print(f'{self.command} {self.path} {self.status} {self.encoding or "-"} '
+                  f'{self.bytes_sent} B {elapsed:.1f} ms')
+
+    def log_request(self, code='-', size='-'):
+        self.status = int(code)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            return super().send_head()
+        if not os.path.isfile(path):
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+
+        # Komprimovaná varianta jen pro celý soubor, rozsahy se počítají z nekomprimovaných dat
+        serve_path = path
+        range_header = self.headers.get('Range')
+        if range_header is None:
+            accepted = accepted_encodings(self.headers.get('Accept-Encoding', ''))
+            for encoding, suffix in ENCODINGS:
+                variant = path + suffix
+                if encoding in accepted and os.path.isfile(variant) \
+                        and os.path.getmtime(variant) >= os.path.getmtime(path):
+                    serve_path, self.encoding = variant, encoding
+                    break
+
+        stat = os.stat(serve_path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + self.encoding if self.encoding else ""}"'
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        size = stat.st_size
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        if range_header is not None:
+            match = RANGE_PATTERN.match(range_header.strip())
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    # bytes=-N znamená posledních N bajtů
+                    start = max(size - int(match.group(2)), 0)
+                if start <= end:
+                    status = HTTPStatus.PARTIAL_CONTENT
+            if status != HTTPStatus.PARTIAL_CONTENT:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+
+        file = open(serve_path, 'rb')
+        self.send_response(status)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', self.date_time_string(int(stat.st_mtime)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if self.encoding:
+            self.send_header('Content-Encoding', self.encoding)
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        file.seek(start)
+        self.remaining = end - start + 1
+        return file
+
+    def copyfile(self, source, outputfile):
+        remaining = self.remaining
+        while remaining is None or remaining > 0:
+            chunk = source.read(64 * 1024 if remaining is None else min(64 * 1024, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            self.bytes_sent += len(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+
+
+def create_server(directory, port):
+    handler = partial(PreviewHandler, directory=directory)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    print(f'Náhled mapy: http://127.0.0.1:{port}/mapa.html')
+    return server
+
+# Spuštění serveru ve vlákně na pozadí (např. vedle sledování změn)
+def start_server(directory, port):
+    server = create_server(directory, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def serve(directory, port):
+    server = create_server(directory, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lokální náhledový server sestavené mapy.')
+    parser.add_argument('directory', nargs='?', default='.', help='adresář se sestavenou mapou')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='port serveru')
+    args = parser.parse_args()
+    serve(args.directory, args.port)
+
+
+if __name__ == '__main__':
+    main()
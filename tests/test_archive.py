@@ -0,0 +1,86 @@
+import os
+import shutil
+
+import pytest
+
+import main
+from benchmark import generate_archive, write_synthetic_gpx
+from main import build, parse_args
+from test_streaming import build_output
+
+
+# Sestavení v adresáři; vrací cesty souborů, které se načítaly přes load_segments
+def run_build(directory, monkeypatch, flags):
+    requested = []
+    load_segments = main.load_segments
+
+    def recording_load_segments(gpx_files, *args):
+        requested.extend(gpx_file for gpx_file, _, _ in gpx_files)
+        return load_segments(gpx_files, *args)
+
+    monkeypatch.chdir(directory)
+    monkeypatch.setattr(main, 'load_segments', recording_load_segments)
+    build(parse_args(['-j', '1', *flags]))
+    monkeypatch.undo()
+    return requested
+
+# Výstup sestavení bez archivu, mezipaměti a indexu
+def page_output(directory):
+    output = build_output(directory)
+    for name in list(output):
+        if name.startswith(main.ARCHIVE_DIR) or name in ('.gpx_cache.sqlite', main.INDEX_FILE):
+            del output[name]
+    return output
+
+# Výstup sestavení bez archivu ze stejných GPX souborů
+def fresh_output(directory, tmp_path, monkeypatch, flags):
+    fresh = tmp_path / 'fresh'
+    shutil.rmtree(fresh, ignore_errors=True)
+    shutil.copytree(directory / 'gpx', fresh / 'gpx')
+    run_build(fresh, monkeypatch, flags)
+    return page_output(fresh)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    directory = tmp_path / 'archive'
+    paths = generate_archive(str(directory / 'gpx'), 8, 200, segments=2)
+    # Soubor bez výšek a časů (v archivu jako NaN)
+    write_synthetic_gpx(paths[3], 1, 150, seed=7, elevation=False, times=False)
+    return directory
+
+
+@pytest.mark.parametrize('flags', [[], ['--lod']])
+def test_archive_reuses_unchanged_files(archive, tmp_path, monkeypatch, flags):
+    flags = ['--archive', *flags]
+    assert len(run_build(archive, monkeypatch, flags)) == 8
+    assert run_build(archive, monkeypatch, flags) == []
+
+    paths = sorted(str(path.relative_to(archive)) for path in (archive / 'gpx').iterdir())
+    write_synthetic_gpx(archive / paths[1], 3, 120, seed=11)
+    os.remove(archive / paths[5])
+    added = os.path.join('gpx', '20991231 - Nová.gpx')
+    write_synthetic_gpx(archive / added, 1, 90, seed=12)
+    assert sorted(run_build(archive, monkeypatch, flags)) == sorted([paths[1], added])
+    assert page_output(archive) == fresh_output(archive, tmp_path, monkeypatch, flags[1:])
+    assert run_build(archive, monkeypatch, flags) == []
+
+
+def test_archive_rebuilds_routes_from_archived_segments(archive, tmp_path, monkeypatch):
+    run_build(archive, monkeypatch, ['--archive'])
+    # Jiné nastavení: trasy, středy i statistiky se sestaví z archivu, bez čtení GPX souborů
+    assert run_build(archive, monkeypatch, ['--archive', '--lod', '-t', '5']) == []
+    assert page_output(archive) == fresh_output(archive, tmp_path, monkeypatch, ['--lod', '-t', '5'])
+
+
+def test_archive_writes_new_generation(archive, monkeypatch):
+    run_build(archive, monkeypatch, ['--archive'])
+    directory = archive / main.ARCHIVE_DIR
+    assert sorted(os.listdir(directory)) == ['g1', 'routes.json']
+    # Pole načteného archivu zůstávají namapovaná; změna se zapíše do nové generace místo přepsání
+    loaded = main.load_archive(str(directory))
+    write_synthetic_gpx(next((archive / 'gpx').iterdir()), 2, 100, seed=13)
+    run_build(archive, monkeypatch, ['--archive'])
+    assert sorted(os.listdir(directory)) == ['g2', 'routes.json']
+    assert len(loaded['segment_coords']) > 0
+    assert main.load_archive(str(directory))['generation'] == 'g2'
@@ -0,0 +1,98 @@
+import random
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from main import group_routes
+
+
+# Původní implementace (před seskupováním přes ordinální čísla dnů) jako reference
+def reference_group_routes(routes):
+    grouped = defaultdict(list)
+
+    for route in routes:
+        place = route["title"]
+        date_str = route["date"]
+        dates = []
+        if '–' in date_str:
+            start_date_str, end_date_str = date_str.split('–')
+            dates.append(datetime.strptime(start_date_str.strip(), '%d.%m.%Y'))
+            dates.append(datetime.strptime(end_date_str.strip(), '%d.%m.%Y'))
+        else:
+            dates.append(datetime.strptime(date_str, '%d.%m.%Y'))
+
+        distance = route.get('stats', {}).get('distance', 0)
+        for current_date in dates:
+            grouped[place].append((current_date, distance))
+            distance = 0
+
+    display_routes = []
+    for place, dates in grouped.items():
+        dates.sort()
+        start_date, distance = dates[0]
+        end_date = start_date
+
+        for current_date, current_distance in dates[1:]:
+            if (current_date - end_date).days == 1:
+                end_date = current_date
+                distance += current_distance
+            else:
+                display_routes.append(reference_entry(place, start_date, end_date, distance))
+                start_date = current_date
+                end_date = current_date
+                distance = current_distance
+        display_routes.append(reference_entry(place, start_date, end_date, distance))
+
+    display_routes.sort(key=lambda x: datetime.strptime(x['date'].split(' – ')[-1], '%d.%m.%Y'))
+    return display_routes
+
+def reference_entry(place, start_date, end_date, distance):
+    if start_date == end_date:
+        return {"place": place, "date": start_date.strftime('%d.%m.%Y'), "distance": distance}
+    return {
+        "place": place,
+        "date": f"{start_date.strftime('%d.%m.%Y')} – {end_date.strftime('%d.%m.%Y')}",
+        "distance": distance,
+    }
+
+# Trasa ve tvaru z build_routes (jen klíče, které group_routes používá)
+def make_route(title, day, distance=None):
+    route = {'title': title, 'date': day.strftime('%d.%m.%Y'), 'day': day.toordinal()}
+    if distance is not None:
+        route['stats'] = {'distance': distance}
+    return route
+
+# Náhodné trasy v krátkém období, aby vznikaly vícedenní úseky i více tras téhož dne
+def random_routes(seed):
+    rnd = random.Random(seed)
+    places = ['Krkonoše', 'Brdy', 'Šumava', 'Orlické hory'][:rnd.randint(1, 4)]
+    start = date(2023, 12, 20)
+    routes = []
+    for _ in range(rnd.randint(1, 40)):
+        day = start + timedelta(days=rnd.randrange(30))
+        distance = rnd.choice([None, 0, round(rnd.uniform(1, 30000), 1)])
+        routes.append(make_route(rnd.choice(places), day, distance))
+    return routes
+
+
+@pytest.mark.parametrize('seed', range(500))
+def test_matches_reference(seed):
+    routes = random_routes(seed)
+    assert group_routes(routes) == reference_group_routes(routes)
+
+
+def test_multi_day_run():
+    routes = [make_route('Brdy', date(2024, 1, 1), 10), make_route('Brdy', date(2024, 1, 2), 5),
+              make_route('Šumava', date(2024, 1, 2), 7), make_route('Brdy', date(2024, 1, 3), 1)]
+    assert group_routes(routes) == [
+        {'place': 'Šumava', 'date': '02.01.2024', 'distance': 7},
+        {'place': 'Brdy', 'date': '01.01.2024 – 03.01.2024', 'distance': 16},
+    ]
+
+
+# Více tras téhož dne na stejném místě zůstávají samostatné položky (jako dřív)
+def test_duplicate_days():
+    routes = [make_route('Brdy', date(2024, 1, 1), 10), make_route('Brdy', date(2024, 1, 1), 5)]
+    assert group_routes(routes) == reference_group_routes(routes)
+    assert len(group_routes(routes)) == 2
@@ -0,0 +1,29 @@
+import json
+import os
+
+import main
+from benchmark import write_synthetic_gpx
+from main import build, parse_args
+
+
+def test_build_uses_index_instead_of_stat(tmp_path, monkeypatch):
+    # Stejný název souboru ve dvou podadresářích
+    for year in ('2023', '2024'):
+        os.makedirs(tmp_path / 'gpx' / year)
+        write_synthetic_gpx(tmp_path / 'gpx' / year / '20240501 - Brdy.gpx', 1, 50, seed=int(year))
+    monkeypatch.chdir(tmp_path)
+    build(parse_args(['-j', '1']))
+    with open(main.STATS_FILE, encoding='utf-8') as file:
+        assert [trip['file'] for trip in json.load(file)] == ['2023/20240501 - Brdy.gpx', '2024/20240501 - Brdy.gpx']
+
+    # Druhé sestavení (segmenty z mezipaměti) soubory znovu nestatuje, velikosti a časy jsou v indexu
+    stats = []
+    stat = os.stat
+
+    def recording_stat(path, *args, **kwargs):
+        stats.append(os.fspath(path))
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', recording_stat)
+    build(parse_args(['-j', '1']))
+    assert [path for path in stats if path.endswith('.gpx')] == []
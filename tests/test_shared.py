@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from main import share_geometry, simplify_points, SHARED_TOLERANCE
+
+ORIGIN = (50.2, 15.8)
+METERS = np.array([111_320, 111_320 * np.cos(np.radians(ORIGIN[0]))])
+
+
+# Náhodná chůze po ~1,3 m jako v syntetických GPX souborech benchmarku
+def walk(count, seed, start=ORIGIN):
+    rnd = np.random.default_rng(seed)
+    heading = np.cumsum(rnd.normal(0, 0.08, count)) + rnd.uniform(0, 2 * np.pi)
+    steps = rnd.uniform(1.0, 1.6, count)
+    return start + np.cumsum(np.column_stack([np.cos(heading), np.sin(heading)]) * steps[:, None], axis=0) / METERS
+
+# Nový záznam stejné cesty: GPS šum se směrodatnou odchylkou sigma metrů
+def rerecord(coords, sigma, seed):
+    return coords + np.random.default_rng(seed).normal(0, sigma, coords.shape) / METERS
+
+def make_routes(*tracks):
+    return [{'points': simplify_points(track.tolist(), 2.0), 'title': f'Trasa {trip}',
+             'date': '01.05.2024', 'trip': trip} for trip, track in enumerate(tracks)]
+
+# Body trasy složené z vlastních bodů a sdílených úseků, jako joinParts ve stránce
+def join_parts(parts, shared):
+    points = []
+    for part in parts:
+        if isinstance(part, int):
+            points.extend(shared[~part][::-1] if part < 0 else shared[part])
+        else:
+            points.extend(part)
+    return points
+
+# Největší vzdálenost (m) bodů od lomené čáry
+def distance_to_line(points, line):
+    points, line = np.asarray(points) * METERS, np.asarray(line) * METERS
+    a, ab = line[:-1], np.diff(line, axis=0)
+    ap = points[:, None, :] - a[None, :, :]
+    t = np.clip((ap * ab).sum(axis=2) / np.maximum((ab * ab).sum(axis=1), 1e-12), 0, 1)
+    return np.hypot(*(ap - t[:, :, None] * ab).transpose(2, 0, 1)).min(axis=1).max()
+
+
+@pytest.mark.parametrize('sigma', [0.5, 2, 5])
+def test_noisy_rerecording_shares_geometry(sigma, capsys):
+    base = walk(3000, 1)
+    routes = make_routes(rerecord(base, 0.5, 10), rerecord(base, sigma, 11), rerecord(base, sigma, 12)[::-1])
+    shared_routes, shared = share_geometry(routes)
+
+    assert shared
+    total = sum(len(route['points']) for route in routes)
+    stored = sum(map(len, shared)) + sum(len(part) for route in shared_routes for part in route['parts']
+                                         if not isinstance(part, int))
+    # Oba nové záznamy se skládají převážně z bodů prvního
+    assert stored < total - 0.8 * (len(routes[1]['points']) + len(routes[2]['points']))
+    assert 'ušetřeno' in capsys.readouterr().out
+    assert join_parts(shared_routes[0]['parts'], shared) == routes[0]['points']
+    for route, shared_route in zip(routes, shared_routes):
+        joined = join_parts(shared_route['parts'], shared)
+        assert distance_to_line(joined, route['points']) <= 2 * SHARED_TOLERANCE
+        assert distance_to_line(route['points'], joined) <= 2 * SHARED_TOLERANCE
+
+
+def test_duplicate_and_reversed_files_join_exactly(capsys):
+    base = walk(2000, 2)
+    partial = np.vstack([base[:1000], walk(1000, 3, base[999])])
+    routes = make_routes(base, base, base[::-1], partial)
+    shared_routes, shared = share_geometry(routes)
+
+    for route, shared_route in zip(routes[:3], shared_routes):
+        assert join_parts(shared_route['parts'], shared) == route['points']
+    assert all(isinstance(part, int) for part in shared_routes[1]['parts'])
+    assert all(isinstance(part, int) and part < 0 for part in shared_routes[2]['parts'])
+    # Společný začátek se sdílí, vlastní pokračování zůstává
+    assert isinstance(shared_routes[3]['parts'][0], int)
+    assert not isinstance(shared_routes[3]['parts'][-1], int)
+    assert 'Duplicitní soubor: Trasa 1 (01.05.2024) = Trasa 0 (01.05.2024)' in capsys.readouterr().out
+
+
+def test_separate_paths_are_not_shared():
+    # Cesta na východ, souběžná cesta 60 m vedle a cesta, která první jen kříží
+    line = np.column_stack([np.zeros(100), np.linspace(0, 2000, 100)])
+    base = ORIGIN + (line + np.random.default_rng(6).normal(0, 2, line.shape)) / METERS
+    parallel = base + np.array([60, 0]) / METERS
+    crossing = ORIGIN + (line[:, ::-1] + np.array([-1000, 1000])) / METERS
+    shared_routes, shared = share_geometry(make_routes(base, parallel, crossing))
+    assert shared == []
+    assert all(len(route['parts']) == 1 for route in shared_routes)
+
+
+def test_empty_routes_report_no_savings(capsys):
+    shared_routes, shared = share_geometry([])
+    assert (shared_routes, shared) == ([], [])
+    assert 'ušetřeno 0.0%' in capsys.readouterr().out
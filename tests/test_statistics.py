@@ -0,0 +1,22 @@
+import numpy as np
+
+from benchmark import write_synthetic_gpx
+from main import calculate_statistics, parse_gpx_file
+
+
+def test_elevation_noise_is_not_counted_as_climbing(tmp_path):
+    # Profil 80 * sin(i / 900) m (stoupání 80 m, pak klesání na -0,19 * 80 m) se šumem ±1,5 m po 1 s
+    path = tmp_path / '20240501 - Brdy.gpx'
+    write_synthetic_gpx(path, 1, 3000, seed=3)
+    stats, = calculate_statistics(parse_gpx_file(path))
+    profile = 80 * np.sin(np.arange(3000) / 900)
+    assert abs(stats['ascent'] - 80) <= 5
+    assert abs(stats['descent'] - (80 - profile[-1])) <= 5
+
+
+def test_segments_without_elevations(tmp_path):
+    path = tmp_path / '20240501 - Brdy.gpx'
+    write_synthetic_gpx(path, 2, 200, seed=4, elevation=False)
+    statistics = calculate_statistics(parse_gpx_file(path))
+    assert [(stats['ascent'], stats['descent']) for stats in statistics] == [(0, 0), (0, 0)]
+    assert all(stats['distance'] > 0 for stats in statistics)
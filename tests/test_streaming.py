@@ -0,0 +1,91 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import pytest
+
+import main
+from benchmark import generate_archive
+from main import (iter_json, json_default, load_gpx_files, add_gpx_to_map, parse_args, write_folium_page,
+                  write_template_page, LOD_TIERS)
+
+VALUES = [
+    None,
+    [],
+    {},
+    'Orlické hory – Šumava',
+    [1, 2.5, -0.0, 1e-7, True, None],
+    {'a': [], 'b': {}, 'č': [[1, 2], [3, 4]], 'd': {'e': {'f': ['ž', {'g': None}]}}},
+    [{'points': [[50.1, 15.2], [50.2, 15.3]], 'title': 'Brdy', 'tiers': [[10, [[50.1, 15.2]]]]}] * 3,
+    {'cells': {'1,2': [0, 1], '3,-4': [2]}, 'cellSize': 0.05},
+    {'points': np.array([[50.1, 15.2], [50.2, 15.3]]), 'id': np.int64(3)},
+]
+
+
+@pytest.mark.parametrize('value', VALUES)
+@pytest.mark.parametrize('depth', range(5))
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_iter_json_matches_json_dumps(value, depth, ensure_ascii):
+    expected = json.dumps(value, ensure_ascii=ensure_ascii, default=json_default)
+    assert ''.join(iter_json(value, depth, ensure_ascii)) == expected
+
+
+# Serializace dat najednou, jako ve stránce vykreslené jedním řetězcem před zápisem po částech
+def single_json(value, depth=1, ensure_ascii=True):
+    yield json.dumps(value, ensure_ascii=ensure_ascii, default=json_default)
+
+# Obsah všech souborů sestavení kromě vstupních GPX
+def build_output(directory):
+    output = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if name != 'gpx']
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as file:
+                output[os.path.relpath(path, directory)] = file.read()
+    return output
+
+
+@pytest.fixture(scope='module')
+def archive(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('archive')
+    generate_archive(str(directory / 'gpx'), 12, 300, segments=2)
+    return directory
+
+
+@pytest.mark.parametrize('flags', [
+    [],
+    ['--encoding', 'polyline', '--lod'],
+    ['--split'],
+    ['--dist'],
+])
+def test_streamed_page_matches_single_string_render(archive, tmp_path, monkeypatch, flags):
+    args = parse_args(flags)
+    routes = add_gpx_to_map(load_gpx_files(str(archive / 'gpx')), lod_tiers=LOD_TIERS if args.lod else None)
+
+    outputs = []
+    for serializer in (iter_json, single_json):
+        directory = tmp_path / serializer.__name__
+        directory.mkdir()
+        monkeypatch.chdir(directory)
+        monkeypatch.setattr(main, 'iter_json', serializer)
+        write_template_page(routes, args, 'mapa.html')
+        outputs.append(build_output(directory))
+    streamed, single = outputs
+    assert 'mapa.html' in streamed
+    assert streamed == single
+
+
+def test_folium_page_is_reproducible_and_skips_empty_routes(archive, tmp_path, monkeypatch):
+    pytest.importorskip('folium')
+    shutil.copytree(archive / 'gpx', tmp_path / 'gpx')
+    with open(tmp_path / 'gpx' / '20991231 - Prázdná.gpx', 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<gpx version="1.1" creator="test">'
+                '<trk><trkseg></trkseg></trk></gpx>\n')
+    routes = add_gpx_to_map(load_gpx_files(str(tmp_path / 'gpx')))
+    assert any(len(route['points']) == 0 for route in routes)
+
+    monkeypatch.chdir(tmp_path)
+    assert write_folium_page(routes, parse_args(['--renderer', 'folium']), 'mapa.html')
+    assert not write_folium_page(routes, parse_args(['--renderer', 'folium']), 'mapa.html')